@@ -26,7 +26,7 @@ setup(
         'Beaker',
         'Jinja2',
         'Babel',
-        'SQLAlchemy>=0.7',
+        'SQLAlchemy>=0.9',
         'FormEncode',
     ],
     zip_safe=False,
@@ -46,6 +46,12 @@ setup(
     entry_points={
         'console_scripts': [
             "duende_shell = duende.lib.command:shell",
+            "duende_routes = duende.lib.command:routes",
+            "duende_compile_templates = duende.lib.command:compile_templates",
+            "duende_compile_catalogs = duende.lib.command:compile_catalogs",
+        ],
+        'beaker.backends': [
+            "memory_lru = duende.lib.cache:MemoryLRUNamespaceManager",
         ],
         'paste.paster_create_template': [
             "duende = duende.lib.pastetemplate:DuendeProjectTemplate",
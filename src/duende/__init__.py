@@ -30,11 +30,10 @@
 
 import os
 
-from pkg_resources import require
-
 from webob import exc as httpexc
 from paste.registry import StackedObjectProxy
 
+from duende.lib import registry
 from duende.lib import urls
 from duende.lib.config import CONFIG
 from duende.lib.request import Request
@@ -47,6 +46,8 @@ REQUEST = StackedObjectProxy(name='request')
 def get_enabled_app_list():
     """Get a list with names of all enabled applications."""
 
+    if registry.REGISTRY is not None:
+        return registry.REGISTRY.app_names
 
     mapping = urls.get_url_mapping()
 
@@ -63,7 +64,7 @@ def guess_version(app_name, file_name):
 
     version = '(not installed)'
     try:
-        info = require(app_name)[0]
+        info = registry.get_distribution(app_name)
         base_path = os.path.dirname(file_name)
         base_path = os.path.dirname(base_path)
         #for applications with namespace we need to dig one more level
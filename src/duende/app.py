@@ -28,24 +28,22 @@
 # THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
-import os
-
 from paste.deploy.converters import asbool
 from paste.registry import RegistryManager
 from paste.cascade import Cascade
 from paste.cgitb_catcher import CgitbMiddleware
 from paste.evalexception import EvalException
 from beaker.middleware import SessionMiddleware
-#TODO: Add beaker cache support
-#from beaker.cache import CacheManager
 
 from duende import get_enabled_app_list
 from duende.lib import urls
-from duende.lib.resource import get_resource_dir
+from duende.lib.discovery import preload_views
 from duende.lib.config import CONFIG
+from duende.lib.registry import init_app_registry
 from duende.middleware.duendeapp import DuendeApplication
 from duende.middleware.auth import AuthMiddleware
 from duende.middleware.error import ErrorMiddleware
+from duende.middleware.resource import ResourceMiddleware
 from duende.middleware.viewresolver import ViewResolverMiddleware
 from duende.middleware.staticcontent import StaticContentMiddleware
 from duende.middleware.flashmessage import FlashMessageMiddleware
@@ -60,12 +58,27 @@ def app_factory(global_config, **local_conf):
     CONFIG.update_values(global_config.copy())
     CONFIG.update_values(local_conf)
 
+    #init URL mappings and enabled applications information once
+    urls.init_application_urls(CONFIG['url.file'])
+    init_app_registry(urls.get_url_mapping())
+
     application = DuendeApplication(CONFIG)
+
+    #import all views before serving requests when preload is enabled
+    view_index = None
+    if asbool(CONFIG.get('view.preload')):
+        view_index = preload_views(get_enabled_app_list())
+
     application = AuthMiddleware(application, CONFIG)
-    application = ViewResolverMiddleware(application, CONFIG)
+    application = ViewResolverMiddleware(application, CONFIG,
+                                         view_index=view_index)
     application = FlashMessageMiddleware(application)
     application = RegistryManager(application)
     application = SessionMiddleware(application, CONFIG)
+    if asbool(CONFIG.get('resource.bypass')):
+        #serve resources without session, auth and translations
+        application = ResourceMiddleware(application)
+
     application = ErrorMiddleware(application, CONFIG)
 
     if asbool(CONFIG['debug']):
@@ -86,16 +99,15 @@ def static_app_factory(global_config, **local_conf):
     config.update(local_conf)
     #initialize mappings to be able to get enabled applications
     urls.init_application_urls(config['url.file'])
+    app_registry = init_app_registry(urls.get_url_mapping())
 
     application_list = []
-    enabled_application_list = get_enabled_app_list()
-    for app_name in enabled_application_list:
-        static_app_dir = get_resource_dir(app_name)
+    for app_info in app_registry:
+        static_app_dir = app_info.static_dir
         if not static_app_dir:
-            #when resource dir does not exist continue with next app
+            #when static dir does not exist continue with next app
             continue
 
-        static_app_dir = os.sep.join([static_app_dir, 'static'])
         static_app = StaticContentMiddleware(static_app_dir,
                                              cache_max_age=None)
         application_list.append(static_app)
@@ -0,0 +1,313 @@
+# -*- coding: utf8 -*-
+#
+# Copyright (c) 2011, Jerónimo José Albi <jeronimo.albi@gmail.com>
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of copyright holders nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+# NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+# THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import os
+import mmap
+import zlib
+import fcntl
+import struct
+import logging
+
+from threading import Lock
+
+from jinja2.bccache import BytecodeCache
+
+LOG = logging.getLogger(__name__)
+
+PACK_MAGIC = 'DBC2'
+#each record has a template cache key, bytecode length, bytecode checksum
+#and bytecode
+RECORD_HEADER = struct.Struct('!40sII')
+#pack files are compacted when they are bigger than this size in bytes
+#and more than half of their contents are outdated records
+COMPACT_MIN_SIZE = 1024 * 1024
+
+
+def _checksum(data):
+    return zlib.crc32(data) & 0xffffffff
+
+
+class PackBytecodeCache(BytecodeCache):
+    """Jinja2 bytecode cache that saves all templates in a single file
+
+    Pack file is shared by all processes. Each process memory maps the
+    file read only and keeps an index with the position of the last
+    bytecode saved for each template. Writes are serialized between
+    processes using file locking and new records are appended to the
+    file. Records that are not fully written are ignored until they are
+    complete, and records with invalid checksums are never used.
+
+    Pack file is rebuilt when it contains invalid records, for example
+    when a process is killed while writing, or when most of its records
+    are outdated. Rebuilt packs are written to a new file that replaces
+    the old one, so processes using the old file are not affected.
+
+    Usage:
+
+        bytecode_cache = PackBytecodeCache('/path/to/cache/dir')
+
+    """
+
+    def __init__(self, directory, name='templates.pack'):
+        self.directory = directory
+        self.name = name
+        self.path = os.path.join(directory, name)
+        self._lock = Lock()
+        self._index = {}
+        self._map = None
+        self._inode = None
+        self._offset = 0
+        #true when a record with an invalid checksum was found
+        self._invalid = False
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+        self._index.clear()
+        self._inode = None
+        self._offset = 0
+        self._invalid = False
+
+    def _refresh(self):
+        """Map pack file again and add new records to index
+
+        This method must be called with lock acquired.
+
+        """
+
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            #pack file is not created yet
+            self._close_map()
+            return
+
+        size = stat.st_size
+        if stat.st_ino != self._inode or size < self._offset:
+            #pack file was rebuilt or cleared
+            self._close_map()
+
+        if size <= len(PACK_MAGIC) or size == self._offset:
+            return
+
+        with open(self.path, 'rb') as pack_file:
+            inode = os.fstat(pack_file.fileno()).st_ino
+            size = os.fstat(pack_file.fileno()).st_size
+            pack_map = mmap.mmap(pack_file.fileno(), size,
+                                 access=mmap.ACCESS_READ)
+
+        if pack_map[:len(PACK_MAGIC)] != PACK_MAGIC:
+            pack_map.close()
+            LOG.error(u'Invalid template bytecode pack file %s', self.path)
+
+            return
+
+        if inode != self._inode:
+            self._close_map()
+
+        if self._map is not None:
+            self._map.close()
+
+        self._map = pack_map
+        self._inode = inode
+        offset = max(self._offset, len(PACK_MAGIC))
+        while not self._invalid and offset + RECORD_HEADER.size <= size:
+            (key, length, checksum) = RECORD_HEADER.unpack_from(pack_map,
+                                                                offset)
+            start = offset + RECORD_HEADER.size
+            end = start + length
+            if end > size:
+                #record is still being written
+                break
+
+            if _checksum(pack_map[start:end]) != checksum:
+                #following records can't be trusted
+                LOG.error(u'Invalid record in template bytecode pack %s',
+                          self.path)
+                self._invalid = True
+                break
+
+            self._index[key] = (start, end)
+            offset = end
+
+        self._offset = offset
+
+    def _get_bytecode(self, key, refresh=False):
+        with self._lock:
+            if refresh or key not in self._index:
+                self._refresh()
+
+            position = self._index.get(key)
+            if not position:
+                return (None, None)
+
+            (start, end) = position
+
+            return (position, self._map[start:end])
+
+    def load_bytecode(self, bucket):
+        (position, data) = self._get_bytecode(bucket.key)
+        if data is None:
+            return
+
+        bucket.bytecode_from_string(data)
+        if bucket.code is None:
+            #bytecode is outdated so check if a newer one was saved
+            (new_position, data) = self._get_bytecode(bucket.key,
+                                                      refresh=True)
+            if new_position != position:
+                bucket.bytecode_from_string(data)
+
+    def _open_locked(self):
+        """Open pack file for appending with an exclusive lock
+
+        Pack file can be replaced while waiting for the lock, so
+        file is opened again until the locked file is the current one.
+
+        """
+
+        while True:
+            pack_file = open(self.path, 'ab')
+            fcntl.flock(pack_file.fileno(), fcntl.LOCK_EX)
+            try:
+                current_inode = os.stat(self.path).st_ino
+            except OSError:
+                current_inode = None
+
+            if os.fstat(pack_file.fileno()).st_ino == current_inode:
+                return pack_file
+
+            pack_file.close()
+
+    def _get_records(self, keys=None):
+        """Get a list of (key, bytecode) tuples for indexed records"""
+
+        if keys is None:
+            keys = self._index.keys()
+
+        records = []
+        for key in keys:
+            (start, end) = self._index[key]
+            records.append((key, self._map[start:end]))
+
+        return records
+
+    def _write_pack(self, records):
+        """Write records to a new pack file that replaces current one
+
+        This method must be called with lock acquired and with pack
+        file locked for writing.
+
+        """
+
+        temp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(temp_path, 'wb') as temp_file:
+            temp_file.write(PACK_MAGIC)
+            for (key, data) in records:
+                temp_file.write(RECORD_HEADER.pack(key, len(data),
+                                                   _checksum(data)))
+                temp_file.write(data)
+
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+
+        os.rename(temp_path, self.path)
+        self._close_map()
+
+    def _needs_rebuild(self, size):
+        if self._invalid or self._offset < size:
+            #file has invalid records, or a record that was not fully
+            #written because writer process died
+            return True
+
+        if size < COMPACT_MIN_SIZE:
+            return False
+
+        live_size = sum(RECORD_HEADER.size + end - start
+                        for (start, end) in self._index.itervalues())
+
+        return (live_size * 2 < size)
+
+    def dump_bytecode(self, bucket):
+        data = bucket.bytecode_to_string()
+        record = RECORD_HEADER.pack(bucket.key, len(data), _checksum(data))
+        record += data
+        with self._lock:
+            pack_file = self._open_locked()
+            try:
+                size = os.fstat(pack_file.fileno()).st_size
+                #no other process is writing, so index covers all records
+                self._refresh()
+                if size > len(PACK_MAGIC) and self._needs_rebuild(size):
+                    LOG.info(u'Rebuilding template bytecode pack %s',
+                             self.path)
+                    records = self._get_records()
+                    records.append((bucket.key, data))
+                    self._write_pack(records)
+                else:
+                    if size == 0:
+                        pack_file.write(PACK_MAGIC)
+
+                    pack_file.write(record)
+                    pack_file.flush()
+            finally:
+                fcntl.flock(pack_file.fileno(), fcntl.LOCK_UN)
+                pack_file.close()
+
+            self._refresh()
+
+    def rebuild(self):
+        """Write a new pack file with only the last record of each template"""
+
+        with self._lock:
+            pack_file = self._open_locked()
+            try:
+                self._refresh()
+                self._write_pack(self._get_records())
+            finally:
+                fcntl.flock(pack_file.fileno(), fcntl.LOCK_UN)
+                pack_file.close()
+
+    def clear(self):
+        """Remove all templates from pack file
+
+        An empty pack file replaces current one, so processes that are
+        reading the old file are not affected.
+
+        """
+
+        with self._lock:
+            pack_file = self._open_locked()
+            try:
+                self._write_pack([])
+            finally:
+                fcntl.flock(pack_file.fileno(), fcntl.LOCK_UN)
+                pack_file.close()
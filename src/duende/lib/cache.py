@@ -0,0 +1,180 @@
+# -*- coding: utf8 -*-
+#
+# Copyright (c) 2011, Jerónimo José Albi <jeronimo.albi@gmail.com>
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of copyright holders nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+# NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+# THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+from collections import OrderedDict
+from threading import Lock
+
+from beaker.cache import CacheManager
+from beaker.container import AbstractDictionaryNSManager
+from beaker.util import SyncDict
+from beaker.util import parse_cache_config_options
+from paste.deploy.converters import asint
+
+CACHE_MANAGER = None
+#cache types that keep values in the memory of each process
+PROCESS_CACHE_TYPES = ('memory', 'memory_lru')
+
+
+_MISSING = object()
+
+
+class LRUCache(object):
+    """Thread safe cache with a bounded number of items
+
+    When cache is full least recently used items are discarded.
+    Cache keeps count of hits, misses and evictions to allow checking
+    its efficiency. A max_size of 0 disables the cache.
+
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._items[key]
+
+    def keys(self):
+        return self._items.keys()
+
+    def get(self, key, default=None):
+        """Get a cached value and mark it as recently used"""
+
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                self.misses += 1
+
+                return default
+
+            #insert value again to move it to the end of the list
+            self._items[key] = value
+            self.hits += 1
+
+        return value
+
+    def set(self, key, value):
+        """Add a value to the cache discarding old values when full"""
+
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            if key in self._items:
+                del self._items[key]
+            elif len(self._items) >= self.max_size:
+                #remove least recently used item
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+            self._items[key] = value
+
+    def clear(self):
+        """Remove all cached values"""
+
+        with self._lock:
+            self._items.clear()
+
+    def get_stats(self):
+        """Get a dictionary with cache usage counters"""
+
+        stats = {}
+        stats['size'] = len(self._items)
+        stats['max_size'] = self.max_size
+        stats['hits'] = self.hits
+        stats['misses'] = self.misses
+        stats['evictions'] = self.evictions
+
+        return stats
+
+
+class MemoryLRUNamespaceManager(AbstractDictionaryNSManager):
+    """Beaker namespace manager that keeps a bounded number of items
+
+    Backend is registered in beaker as memory_lru cache type.
+    Number of items for each namespace is given with cache.max_items.
+
+    """
+
+    namespaces = SyncDict()
+
+    def __init__(self, namespace, max_items=1000, **kwargs):
+        AbstractDictionaryNSManager.__init__(self, namespace)
+        namespaces = MemoryLRUNamespaceManager.namespaces
+        self.dictionary = namespaces.get(self.namespace, LRUCache,
+                                         asint(max_items))
+
+
+def init_cache_manager(config):
+    """Initialize global cache manager using cache.* config values"""
+
+    global CACHE_MANAGER
+
+    cache_options = parse_cache_config_options(config.copy())
+    CACHE_MANAGER = CacheManager(**cache_options)
+
+
+def get_cache(namespace, **kwargs):
+    """Get a beaker Cache for a namespace from global cache manager"""
+
+    return CACHE_MANAGER.get_cache(namespace, **kwargs)
+
+
+def get_cache_region(namespace, region):
+    """Get a beaker Cache for a namespace using a configured cache region
+
+    Regions are configured using cache.regions and cache.<region>.*
+    config values.
+
+    """
+
+    return CACHE_MANAGER.get_cache_region(namespace, region)
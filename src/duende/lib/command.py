@@ -27,13 +27,30 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
 # THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
+import argparse
 import code
 import os
 import sys
+import time
 
 from paste.deploy import loadapp
+from paste.deploy.converters import asbool
+
+from duende import httpexc
+from duende import get_enabled_app_list
+from duende.lib import template
+from duende.lib import urls
+from duende.lib.config import CONFIG
+from duende.lib.i18n import catalog
+from duende.lib.i18n import translation
+from duende.lib.discovery import find_app_views
+from duende.lib.discovery import preload_views
 
 BANNER = "Duende interactive console"
+ROUTES_DESCRIPTION = "Display URL to view mappings and time URL resolution."
+COMPILE_TEMPLATES_DESCRIPTION = "Compile templates of enabled applications."
+COMPILE_CATALOGS_DESCRIPTION = ("Create compact translation catalogs for "
+                                "enabled applications.")
 
 
 class SimpleConsole(code.InteractiveConsole):
@@ -48,6 +65,23 @@ class SimpleConsole(code.InteractiveConsole):
         self.interact(header)
 
 
+def load_app(config_file):
+    """Load duende WSGI application for a config file"""
+
+    config_path = os.path.abspath(config_file)
+    if not os.path.isfile(config_path):
+        raise Exception(u'Config file %s not found' % config_path)
+
+    cur_dir = os.path.dirname(config_path)
+    if cur_dir not in sys.path:
+        sys.path.insert(0, cur_dir)
+
+    print("Loading duende app config from {0}".format(config_path))
+    config_key = 'config:%s' % config_path
+
+    return loadapp(config_key)
+
+
 def shell():
     """Initialize an interactive shell for Duende.
 
@@ -63,17 +97,7 @@ def shell():
     else:
         config_file = sys.argv[1]
 
-    config_path = os.path.abspath(config_file)
-    if not os.path.isfile(config_path):
-        raise Exception(u'Config file %s not found' % config_path)
-
-    cur_dir = os.path.dirname(config_path)
-    if cur_dir not in sys.path:
-        sys.path.insert(0, cur_dir)
-
-    print("Loading duende app config from {0}".format(config_path))
-    config_key = 'config:%s' % config_path
-    wsgiapp = loadapp(config_key)
+    wsgiapp = load_app(config_file)
 
     try:
         import IPython
@@ -89,3 +113,219 @@ def shell():
         shell = SimpleConsole()
         
     shell(header=BANNER)
+
+
+def get_view_url(base_url, module_path, view_name):
+    """Get the URL that resolves to a view by URL convention
+
+    Only root application index view is resolved for the application
+    base URL, because URLs with a single path element, like /blog/,
+    are resolved as views of the root application.
+
+    """
+
+    url = base_url.rstrip('/')
+    if module_path != 'root':
+        url = url + '/' + module_path.replace('.', '/')
+    elif view_name == 'index' and not url:
+        return '/'
+
+    return url + '/' + view_name
+
+
+def print_url_mappings():
+    """Print resources, routes and views available for each application"""
+
+    print("Resources:")
+    resource_mapping = urls.get_resource_mapping()
+    for name in sorted(resource_mapping):
+        print("  /{0:<40} {1}".format(name, resource_mapping[name]))
+
+    print("\nRoutes:")
+    for (name, pattern, view_uri) in urls.get_route_mapping():
+        print("  {0:<41} {1} ({2})".format(pattern, view_uri, name))
+
+    url_mapping = urls.get_url_mapping()
+    for app_name in sorted(get_enabled_app_list()):
+        base_url = url_mapping[app_name]
+        print("\nApplication {0} ({1}):".format(app_name, base_url))
+        for (module_path, name, view) in find_app_views(app_name):
+            url = get_view_url(base_url, module_path, name)
+            view_path = '%s.view.%s.%s' % (app_name, module_path, name)
+            print("  {0:<41} {1}".format(url, view_path))
+
+
+def get_percentile(sorted_values, percent):
+    index = int(round((len(sorted_values) - 1) * percent / 100.0))
+
+    return sorted_values[index]
+
+
+def time_url_resolution(url_list, iterations, use_cache=True):
+    """Print time needed by view resolver to resolve each URL"""
+
+    #import here to avoid loading middlewares when importing this module
+    from duende.middleware.viewresolver import ViewResolverMiddleware
+
+    config = CONFIG.copy()
+    if not use_cache:
+        config['view.cache_size'] = 0
+        config['view.not_found_cache_size'] = 0
+
+    view_index = None
+    if asbool(config.get('view.preload')):
+        view_index = preload_views(get_enabled_app_list())
+
+    resolver = ViewResolverMiddleware(None, config, view_index=view_index)
+    print("\n{0:<40} {1:>6} {2:>10} {3:>10} {4:>10} {5:>8}".format(
+          "URL", "Status", "First(ms)", "p50(ms)", "p99(ms)", "Imports"))
+    for url in url_list:
+        timings = []
+        for index in xrange(iterations + 1):
+            environ = {'PATH_INFO': url}
+            module_count = len(sys.modules)
+            start_time = time.time()
+            try:
+                resolver.resolve_view_handler(environ)
+                status = 200
+            except httpexc.HTTPException, exc:
+                status = exc.code
+
+            elapsed = (time.time() - start_time) * 1000
+            if index == 0:
+                #first resolution includes view module imports
+                first_time = elapsed
+                import_count = len(sys.modules) - module_count
+            else:
+                timings.append(elapsed)
+
+        timings.sort()
+        print("{0:<40} {1:>6} {2:>10.4f} {3:>10.4f} {4:>10.4f} {5:>8}".format(
+              url, status, first_time, get_percentile(timings, 50),
+              get_percentile(timings, 99), import_count))
+
+
+def get_routes_argument_parser():
+    """Get an ArgumentParser to process duende_routes arguments."""
+
+    arg_parser = argparse.ArgumentParser(description=ROUTES_DESCRIPTION)
+    arg_parser.add_argument('config', nargs='?', default='duende.ini',
+                            help='Config file (default: duende.ini)')
+    arg_parser.add_argument('-u', '--url', action='append', default=[],
+                            dest='url_list', help='URL to time resolution')
+    arg_parser.add_argument('-f', '--file', dest='url_file',
+                            help='File with a URL to time in each line')
+    arg_parser.add_argument('-n', '--iterations', type=int, default=1000,
+                            help='Resolutions to time for each URL')
+    arg_parser.add_argument('--no-cache', action='store_false',
+                            dest='use_cache',
+                            help='Disable resolver caches when timing')
+
+    return arg_parser
+
+
+def routes():
+    """Display URL mappings and time URL resolution for Duende.
+
+    URL to time can be given as arguments or in a file.
+
+    Example:
+        # duende_routes duende.ini -u /user/login -f urls.txt
+
+    """
+
+    arg_parser = get_routes_argument_parser()
+    args = arg_parser.parse_args()
+    if args.iterations < 1:
+        arg_parser.error('iterations must be 1 or greater')
+
+    load_app(args.config)
+    print_url_mappings()
+
+    url_list = list(args.url_list)
+    if args.url_file:
+        with open(args.url_file) as url_file:
+            for line in url_file:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    url_list.append(line)
+
+    if url_list:
+        time_url_resolution(url_list, args.iterations, args.use_cache)
+
+
+def get_compile_templates_argument_parser():
+    """Get an ArgumentParser to process duende_compile_templates arguments."""
+
+    description = COMPILE_TEMPLATES_DESCRIPTION
+    arg_parser = argparse.ArgumentParser(description=description)
+    arg_parser.add_argument('config', nargs='?', default='duende.ini',
+                            help='Config file (default: duende.ini)')
+    arg_parser.add_argument('-o', '--output', dest='target',
+                            help='Directory or zip file where to save '
+                                 'compiled templates (default: '
+                                 'template.compiled_path config value)')
+    arg_parser.add_argument('-z', '--zip', action='store_const',
+                            const='deflated', default=None,
+                            help='Save compiled templates in a zip file')
+
+    return arg_parser
+
+
+def compile_templates():
+    """Compile templates of all enabled applications for Duende.
+
+    Compiled templates are used when template.compiled config
+    value is true.
+
+    Example:
+        # duende_compile_templates duende.ini
+
+    """
+
+    arg_parser = get_compile_templates_argument_parser()
+    args = arg_parser.parse_args()
+    load_app(args.config)
+
+    target = args.target or CONFIG.get('template.compiled_path')
+    if not target:
+        arg_parser.error('No output given and template.compiled_path '
+                         'is not set')
+
+    target = os.path.abspath(target)
+    print("Compiling templates to {0}".format(target))
+    template.compile_templates(CONFIG, target, zip=args.zip)
+
+
+def get_compile_catalogs_argument_parser():
+    """Get an ArgumentParser to process duende_compile_catalogs arguments."""
+
+    description = COMPILE_CATALOGS_DESCRIPTION
+    arg_parser = argparse.ArgumentParser(description=description)
+    arg_parser.add_argument('config', nargs='?', default='duende.ini',
+                            help='Config file (default: duende.ini)')
+
+    return arg_parser
+
+
+def compile_catalogs():
+    """Create compact translation catalogs for Duende applications.
+
+    A catalog is created for each .mo file found in enabled
+    applications locale directory.
+    Compact catalogs are used when i18n.compact_catalogs config
+    value is true.
+
+    Example:
+        # duende_compile_catalogs duende.ini
+
+    """
+
+    arg_parser = get_compile_catalogs_argument_parser()
+    args = arg_parser.parse_args()
+    load_app(args.config)
+
+    domains = translation.get_translation_domains()
+    for (domain, locale_dir) in sorted(domains.iteritems()):
+        for (language, count) in catalog.compile_catalogs(domain, locale_dir):
+            print("{0} [{1}]: {2} messages".format(domain, language, count))
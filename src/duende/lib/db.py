@@ -27,20 +27,320 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
 # THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
+
+import re
+import time
+import uuid
+import hashlib
+import logging
+import cPickle as pickle
+
+from itertools import count
+from itertools import izip
+from operator import attrgetter
+
+from threading import Lock
+from threading import local
+
+from sqlalchemy import and_
+from sqlalchemy import bindparam
+from sqlalchemy import event
 from sqlalchemy import Column
 from sqlalchemy import engine_from_config
 from sqlalchemy import MetaData
+from sqlalchemy import or_
+from sqlalchemy import select
 from sqlalchemy import Sequence
+from sqlalchemy import text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm import Session
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import class_mapper
+from sqlalchemy.orm import configure_mappers
 from sqlalchemy.orm import object_mapper
+from sqlalchemy.orm.query import Query
+from sqlalchemy.sql.expression import TextClause
+from sqlalchemy.sql.expression import UpdateBase
+from sqlalchemy.sql.util import find_tables
 from sqlalchemy.types import Integer
 
+from duende.lib import cache
+
+#dialect specific insert constructs that support upserts
+UPSERT_INSERTS = {}
+try:
+    from sqlalchemy.dialects.postgresql import insert as pg_insert
+except ImportError:
+    pass
+else:
+    UPSERT_INSERTS['postgresql'] = pg_insert
+
+try:
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+except ImportError:
+    pass
+else:
+    UPSERT_INSERTS['sqlite'] = sqlite_insert
+
+LOG = logging.getLogger(__name__)
+
 META = MetaData()
 SESSION = None
 ENGINE = None
+#list of (name, engine) tuples for read replicas
+REPLICAS = []
+
+#database.* config options that are not engine options
+DUENDE_OPTIONS = set(['stats_header', 'replica_strategy', 'profile',
+                      'slow_query_ms', 'explain_slow_queries',
+                      'repeated_query_limit'])
+#prefix for read replica engine options
+REPLICA_PREFIX = 'database.replica.'
+#valid strategies to choose a replica for reads
+REPLICA_STRATEGIES = ('round_robin', 'least_connections')
+REPLICA_STRATEGY = 'round_robin'
+#request methods that can read data from replicas
+READ_METHODS = ('GET', 'HEAD')
+
+#matches locking clauses of text SELECT statements
+LOCKING_READ_RE = re.compile(r'\bfor\s+(?:update|share|no\s+key\s+update|'
+                             r'key\s+share)\b|\block\s+in\s+share\s+mode\b')
+#thread local storage for current request replica routing
+_ROUTING = local()
+_REPLICA_COUNTER = count()
+#number of queries executed by each engine
+ENGINE_STATS = {}
+_ENGINE_STATS_LOCK = Lock()
+
+#thread local storage for current request database statistics
+_REQUEST_STATS = local()
+
+#cache namespaces for query results and table generations
+QUERY_CACHE_NAMESPACE = 'duende.db.query'
+TABLE_CACHE_NAMESPACE = 'duende.db.tables'
+#default cache region for cached queries
+DEFAULT_CACHE_REGION = 'default'
+#cached query hits and misses for each model
+QUERY_CACHE_STATS = {}
+_QUERY_CACHE_STATS_LOCK = Lock()
+
+
+class DatabaseException(Exception):
+    pass
+
+
+class RequestStats(object):
+    """Database usage statistics for a request
+
+    Times are in seconds. Checkout wait is the time spent waiting for
+    connections from the connection pool.
+
+    """
+
+    __slots__ = ('query_count', 'query_time', 'checkout_count',
+                 'checkout_wait')
+
+    def __init__(self):
+        self.query_count = 0
+        self.query_time = 0.0
+        self.checkout_count = 0
+        self.checkout_wait = 0.0
+
+    def as_dict(self):
+        return {
+            'query_count': self.query_count,
+            'query_time': self.query_time,
+            'checkout_count': self.checkout_count,
+            'checkout_wait': self.checkout_wait,
+        }
+
+    def __unicode__(self):
+        return (u'queries=%d; time=%.2fms; checkouts=%d; wait=%.2fms'
+                % (self.query_count, self.query_time * 1000,
+                   self.checkout_count, self.checkout_wait * 1000))
+
+
+def start_request_stats():
+    """Start recording database statistics for current request"""
+
+    stats = _REQUEST_STATS.current = RequestStats()
+
+    return stats
+
+
+def get_request_stats():
+    """Get database statistics for current request or None"""
+
+    return getattr(_REQUEST_STATS, 'current', None)
+
+
+def finish_request_stats():
+    """Stop recording database statistics for current request"""
+
+    stats = get_request_stats()
+    _REQUEST_STATS.current = None
+
+    return stats
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if get_request_stats() is not None:
+        conn.info.setdefault('duende.query_start', []).append(time.time())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    stats = get_request_stats()
+    start_list = conn.info.get('duende.query_start')
+    if stats is None or not start_list:
+        return
+
+    stats.query_count += 1
+    stats.query_time += time.time() - start_list.pop()
+
+
+def _record_pool_checkout(pool):
+    """Wrap pool connect method to record checkout wait times"""
+
+    pool_connect = pool.connect
+
+    def connect(*args, **kwargs):
+        stats = get_request_stats()
+        if stats is None:
+            return pool_connect(*args, **kwargs)
+
+        start_time = time.time()
+        try:
+            return pool_connect(*args, **kwargs)
+        finally:
+            stats.checkout_count += 1
+            stats.checkout_wait += time.time() - start_time
+
+    pool.connect = connect
+
+
+def _count_engine_queries(name):
+    """Get a cursor execute listener that counts queries for an engine"""
+
+    with _ENGINE_STATS_LOCK:
+        ENGINE_STATS[name] = 0
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                               executemany):
+        with _ENGINE_STATS_LOCK:
+            ENGINE_STATS[name] += 1
+
+    return _before_cursor_execute
+
+
+def get_engine_stats():
+    """Get a dictionary with number of queries executed by each engine
+
+    Primary engine is named "primary" and replicas are named
+    "replica.<N>".
+
+    """
+
+    with _ENGINE_STATS_LOCK:
+        return dict(ENGINE_STATS)
+
+
+def start_request_routing(method):
+    """Init replica routing for a request using request method
+
+    Only requests that read data, like GET requests, can use replicas.
+
+    """
+
+    _ROUTING.use_replicas = (method in READ_METHODS)
+
+
+def finish_request_routing():
+    """Finish replica routing for current request"""
+
+    _ROUTING.__dict__.clear()
+
+
+def _use_replicas():
+    if not REPLICAS:
+        return False
+
+    #outside requests replicas are allways used for reads
+    return getattr(_ROUTING, 'use_replicas', True)
+
+
+def _get_checked_out(engine):
+    #only some pool classes keep track of checked out connections
+    checked_out = getattr(engine.pool, 'checkedout', None)
+
+    return (checked_out() if checked_out else 0)
+
+
+def get_replica():
+    """Get a (name, engine) tuple for a read replica
+
+    Replica is choosen using database.replica_strategy.
+
+    """
+
+    if REPLICA_STRATEGY == 'least_connections':
+        return min(REPLICAS, key=lambda item: _get_checked_out(item[1]))
+
+    index = _REPLICA_COUNTER.next() % len(REPLICAS)
+
+    return REPLICAS[index]
+
+
+def _is_read_statement(clause):
+    if clause is None or isinstance(clause, UpdateBase):
+        return False
+    elif isinstance(clause, TextClause):
+        sql = clause.text.lstrip().lower()
+        return sql[:6] == 'select' and not LOCKING_READ_RE.search(sql)
+
+    #SELECT ... FOR UPDATE locks rows, so it must run in primary engine
+    if hasattr(clause, '_for_update_arg'):
+        return clause._for_update_arg is None
+
+    #older SQLAlchemy versions use for_update attribute
+    return not getattr(clause, 'for_update', False)
+
+
+class RoutingSession(Session):
+    """Session that reads data from replicas and writes to primary engine
+
+    A replica is choosen for each session, so all session reads use the
+    same replica. Once a session writes data all following statements
+    are sent to the primary engine, so changes are visible for the rest
+    of the request. Cached queries are allways read from primary engine
+    when they are not found in the cache.
+
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        use_primary = (self.info.get('duende.db.primary')
+                       or self.info.get('duende.db.cache_read'))
+        if use_primary or not _use_replicas():
+            return Session.get_bind(self, mapper=mapper, clause=clause,
+                                    **kwargs)
+
+        if self._flushing or not _is_read_statement(clause):
+            #read your writes
+            self.info['duende.db.primary'] = True
+
+            return Session.get_bind(self, mapper=mapper, clause=clause,
+                                    **kwargs)
+
+        #use the same replica for all reads of a session
+        engine = self.info.get('duende.db.replica')
+        if engine is None:
+            (name, engine) = get_replica()
+            self.info['duende.db.replica'] = engine
+
+        return engine
 
 
 def execute(sql, **kwargs):
@@ -60,6 +360,276 @@ def execute(sql, **kwargs):
     return result
 
 
+def stream(sql, batch_size=1000, **kwargs):
+    """Execute an SQL statement and iterate result rows in batches
+
+    Rows are fetched batch_size rows at a time using server side cursors
+    when database driver supports them, so results are not loaded in
+    memory all at once. SQL parameters are given as keyword arguments,
+    like in execute function.
+
+    Example:
+        for row in stream('SELECT * FROM some_table', batch_size=500):
+            ...
+
+    """
+
+    if isinstance(sql, basestring):
+        sql = text(sql)
+
+    sql = sql.execution_options(stream_results=True)
+    result = SESSION.execute(sql, kwargs)
+    try:
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+
+            for row in rows:
+                yield row
+    finally:
+        result.close()
+
+
+def get_table_generation(table_name):
+    """Get current cache generation for a table
+
+    Generation changes each time table data is changed using
+    a Session, so cached query results for the table are discarded.
+    Generations are only shared between processes when cache.type
+    is not a process local type, like memory or memory_lru.
+    A new generation is created when table has no generation, so results
+    cached for discarded generations are never used again.
+
+    """
+
+    table_cache = cache.get_cache(TABLE_CACHE_NAMESPACE)
+    try:
+        return table_cache.get(table_name)
+    except KeyError:
+        generation = uuid.uuid4().hex
+        table_cache.put(table_name, generation)
+
+        return generation
+
+
+def mark_tables_changed(table_names):
+    """Invalidate cached queries that use any of the given tables"""
+
+    table_cache = cache.get_cache(TABLE_CACHE_NAMESPACE)
+    for table_name in table_names:
+        generation = uuid.uuid4().hex
+        table_cache.put(table_name, generation)
+        LOG.debug(u'Table %s cache generation is %s', table_name, generation)
+
+
+def _record_query_cache_stats(name, hit):
+    with _QUERY_CACHE_STATS_LOCK:
+        stats = QUERY_CACHE_STATS.get(name)
+        if stats is None:
+            stats = QUERY_CACHE_STATS[name] = {'hits': 0, 'misses': 0}
+
+        stats['hits' if hit else 'misses'] += 1
+
+
+def get_query_cache_stats(name=None):
+    """Get a dictionary with cached query hits and misses for models
+
+    When a model name is given only stats for that model are returned.
+
+    """
+
+    with _QUERY_CACHE_STATS_LOCK:
+        if name:
+            return dict(QUERY_CACHE_STATS.get(name, {'hits': 0, 'misses': 0}))
+
+        return dict((key, dict(value))
+                    for (key, value) in QUERY_CACHE_STATS.iteritems())
+
+
+class CachingQuery(Query):
+    """Query class that can save query results in a cache region
+
+    Results are pickled, so cached instances are detached copies that
+    are merged into query session when they are loaded from cache.
+    Cached results are discarded when data of any table used in query
+    is changed using a Session.
+
+    Usage:
+
+        query = Model.query().filter_by(code='ES').cache('long')
+
+    """
+
+    _cache_region = None
+
+    def cache(self, region=DEFAULT_CACHE_REGION):
+        """Get a copy of current query that caches results in a region"""
+
+        query = self._clone()
+        query._cache_region = region
+
+        return query
+
+    def stream(self, batch_size=1000):
+        """Iterate query instances loading them in batches
+
+        Instances are loaded batch_size rows at a time using server side
+        cursors when database driver supports them. Results are never
+        cached. Eager loading of collections can't be used when
+        streaming, see SQLAlchemy Query.yield_per documentation.
+
+        """
+
+        query = self.yield_per(batch_size)
+        query._cache_region = None
+
+        return Query.__iter__(query)
+
+    def _get_cache_key(self, statement, table_names):
+        compiled = statement.compile()
+        params = sorted(compiled.params.items())
+        generations = sorted((name, get_table_generation(name))
+                             for name in table_names)
+        key_text = repr((unicode(compiled), params, generations))
+
+        return hashlib.sha1(key_text).hexdigest()
+
+    def _has_uncommitted_changes(self, table_names):
+        """Check if query session has changes that are not commited
+
+        Results for these queries can contain uncommited data, so they
+        must not be cached or read from cache.
+
+        """
+
+        session = self.session
+        if session.new or session.dirty or session.deleted:
+            return True
+
+        changed_tables = session.info.get('duende.changed_tables')
+
+        return bool(changed_tables and changed_tables & table_names)
+
+    def _get_cache_stats_name(self):
+        mapper = self._mapper_zero()
+        if mapper is None:
+            return u'(no model)'
+
+        return mapper.class_.__name__
+
+    def __iter__(self):
+        if self._cache_region is None:
+            return Query.__iter__(self)
+
+        statement = self.with_labels().statement
+        table_names = set(table.name
+                          for table in find_tables(statement,
+                                                   include_aliases=True,
+                                                   include_joins=True))
+        if self._has_uncommitted_changes(table_names):
+            return Query.__iter__(self)
+
+        query_cache = cache.get_cache_region(QUERY_CACHE_NAMESPACE,
+                                             self._cache_region)
+        key = self._get_cache_key(statement, table_names)
+        stats_name = self._get_cache_stats_name()
+        try:
+            data = query_cache.get(key)
+            _record_query_cache_stats(stats_name, hit=True)
+            result = pickle.loads(data)
+        except KeyError:
+            _record_query_cache_stats(stats_name, hit=False)
+            #replicas can lag behind primary, and results read from them
+            #would be cached for the new table generations
+            session_info = self.session.info
+            session_info['duende.db.cache_read'] = True
+            try:
+                result = list(Query.__iter__(self))
+            finally:
+                session_info.pop('duende.db.cache_read', None)
+
+            data = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+            query_cache.put(key, data)
+
+            return iter(result)
+
+        return iter(self.merge_result(result, load=False))
+
+
+def _after_flush(session, flush_context):
+    #save changed tables until transaction is commited
+    table_names = session.info.setdefault('duende.changed_tables', set())
+    for instance in session.new | session.dirty | session.deleted:
+        for table in object_mapper(instance).tables:
+            table_names.add(table.name)
+
+
+def _after_commit(session):
+    table_names = session.info.pop('duende.changed_tables', None)
+    if table_names:
+        mark_tables_changed(table_names)
+
+
+def _after_rollback(session):
+    #flushed data could have been read by other queries before rollback
+    table_names = session.info.pop('duende.changed_tables', None)
+    if table_names:
+        mark_tables_changed(table_names)
+
+
+def _get_upsert_statement(table, dialect_name, keys, columns):
+    """Get a dialect specific upsert statement for a set of columns
+
+    None is returned when dialect or installed SQLAlchemy version
+    does not support upserts.
+
+    """
+
+    insert = UPSERT_INSERTS.get(dialect_name)
+    if not insert:
+        return
+
+    statement = insert(table)
+    update_columns = dict((name, getattr(statement.excluded, name))
+                          for name in columns if name not in keys)
+    if not update_columns:
+        return statement.on_conflict_do_nothing(index_elements=keys)
+
+    return statement.on_conflict_do_update(index_elements=keys,
+                                           set_=update_columns)
+
+
+def _group_rows(rows):
+    """Group rows that have the same column names"""
+
+    groups = {}
+    for row in rows:
+        columns = tuple(sorted(row))
+        groups.setdefault(columns, []).append(row)
+
+    return groups.items()
+
+
+def _iter_chunks(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def _log_bulk_write(table, action, count, start):
+    elapsed = time.time() - start
+    rate = (count / elapsed if elapsed else count)
+    LOG.info(u'Bulk %s of %d rows in table %s took %.3f seconds (%d rows/s)',
+             action, count, table.name, elapsed, rate)
+
+
 class BaseModel(object):
     """Base class for models"""
 
@@ -132,6 +702,183 @@ class BaseModel(object):
 
         return query.get(*args, **kw)
 
+    @classmethod
+    def cached_get(cls, ident, region=DEFAULT_CACHE_REGION, session=None):
+        """Get a model instance by primary key using a cache region
+
+        Instances already loaded in session are returned
+        without using the cache.
+
+        """
+
+        query = cls.query(session=session).cache(region)
+
+        return query.get(ident)
+
+    @classmethod
+    def get_cache_stats(cls):
+        """Get cached query hits and misses for current model class"""
+
+        return get_query_cache_stats(cls.__name__)
+
+    @classmethod
+    def get_table(cls):
+        """Get mapped table for current model class"""
+
+        return class_mapper(cls).local_table
+
+    @classmethod
+    def _get_bulk_session(cls, session, table):
+        if not session:
+            session = SESSION
+
+        #cached queries for table are invalidated when session is commited
+        table_names = session.info.setdefault('duende.changed_tables', set())
+        table_names.add(table.name)
+
+        return session
+
+    @classmethod
+    def bulk_insert(cls, rows, chunk_size=1000, session=None):
+        """Insert rows using one executemany call for each chunk of rows
+
+        Rows are dictionaries with column names as keys. Rows are written
+        using session transaction, so session must be commited to save
+        them. Number of inserted rows is returned.
+
+        """
+
+        table = cls.get_table()
+        session = cls._get_bulk_session(session, table)
+        statement = table.insert()
+        start = time.time()
+        count = 0
+        for chunk in _iter_chunks(rows, chunk_size):
+            session.execute(statement, chunk)
+            count += len(chunk)
+
+        _log_bulk_write(table, 'insert', count, start)
+
+        return count
+
+    @classmethod
+    def bulk_update(cls, rows, chunk_size=1000, session=None):
+        """Update rows by primary key using executemany calls
+
+        Rows are dictionaries with column names as keys and they must
+        contain values for all primary key columns. Only columns present
+        in each row are updated and rows without other columns are skipped.
+        Number of updated rows is returned.
+
+        """
+
+        table = cls.get_table()
+        session = cls._get_bulk_session(session, table)
+        primary_keys = [column.name for column in table.primary_key]
+        start = time.time()
+        count = 0
+        for chunk in _iter_chunks(rows, chunk_size):
+            for (columns, group) in _group_rows(chunk):
+                #primary key values are bound with a prefix because
+                #column names are used for values to update
+                where = [table.c[name] == bindparam('pk_' + name)
+                         for name in primary_keys]
+                values = dict((name, bindparam(name)) for name in columns
+                              if name not in primary_keys)
+                if not values:
+                    #rows with only primary key values have nothing to update
+                    continue
+
+                statement = table.update().where(and_(*where)).values(values)
+                params = []
+                for row in group:
+                    row = dict(row)
+                    for name in primary_keys:
+                        row['pk_' + name] = row.pop(name)
+
+                    params.append(row)
+
+                result = session.execute(statement, params)
+                count += max(result.rowcount, 0)
+
+        _log_bulk_write(table, 'update', count, start)
+
+        return count
+
+    @classmethod
+    def bulk_upsert(cls, rows, keys=None, chunk_size=1000, session=None):
+        """Insert rows or update them when they already exist
+
+        Existing rows are matched using key column names, which by default
+        are primary key columns. Keys must have a unique constraint.
+        PostgreSQL and SQLite use a native INSERT ... ON CONFLICT statement
+        when the installed SQLAlchemy supports it. Other databases select
+        existing keys for each chunk and then insert and update rows.
+        Number of written rows is returned.
+
+        """
+
+        table = cls.get_table()
+        session = cls._get_bulk_session(session, table)
+        if not keys:
+            keys = [column.name for column in table.primary_key]
+
+        dialect_name = session.get_bind(mapper=class_mapper(cls)).dialect.name
+        start = time.time()
+        count = 0
+        for chunk in _iter_chunks(rows, chunk_size):
+            for (columns, group) in _group_rows(chunk):
+                statement = _get_upsert_statement(table, dialect_name, keys,
+                                                  columns)
+                if statement is not None:
+                    session.execute(statement, group)
+                else:
+                    cls._upsert_rows(session, table, keys, group)
+
+                count += len(group)
+
+        _log_bulk_write(table, 'upsert', count, start)
+
+        return count
+
+    @classmethod
+    def _upsert_rows(cls, session, table, keys, rows):
+        """Generic upsert that selects existing keys before writing rows"""
+
+        key_columns = [table.c[name] for name in keys]
+        conditions = [and_(*[column == row[column.name]
+                             for column in key_columns])
+                      for row in rows]
+        query = select(key_columns).where(or_(*conditions))
+        existing = set(tuple(item) for item in session.execute(query))
+        new_rows = []
+        old_rows = []
+        for row in rows:
+            row_keys = tuple(row[name] for name in keys)
+            (old_rows if row_keys in existing else new_rows).append(row)
+
+        if new_rows:
+            session.execute(table.insert(), new_rows)
+
+        if old_rows:
+            where = [column == bindparam('key_' + column.name)
+                     for column in key_columns]
+            values = dict((name, bindparam(name)) for name in rows[0]
+                          if name not in keys)
+            if not values:
+                return
+
+            statement = table.update().where(and_(*where)).values(values)
+            params = []
+            for row in old_rows:
+                row = dict(row)
+                for name in keys:
+                    row['key_' + name] = row.pop(name)
+
+                params.append(row)
+
+            session.execute(statement, params)
+
     @property
     def current_session(self):
         """Get current instance Session"""
@@ -170,28 +917,82 @@ class IterableModel(BaseModel):
     This allow to convert a model instance to dict using dict
     function on model instances.
 
+    Public field names are computed once for each class when its
+    mapper is configured, so iteration and serialization does not
+    need any mapper lookups.
+
     """
 
+    #names of public mapped fields, in column order
+    _public_keys = ()
+    #getter that returns a tuple with public field values
+    _public_getter = staticmethod(lambda obj: ())
+
     def __iter__(self):
-        self._mapper = object_mapper(self)
-        self._col_iter = iter(self._mapper.columns)
+        keys = self._public_keys
+
+        return izip(keys, self._public_getter(self))
+
+    def to_dict(self):
+        """Get a dict with public field values"""
+
+        return dict(izip(self._public_keys, self._public_getter(self)))
 
-        return self
+    def to_tuple(self):
+        """Get a tuple with public field values"""
 
-    def next(self):
+        return self._public_getter(self)
+
+    @classmethod
+    def get_public_keys(cls):
+        """Get a tuple with public field names"""
+
+        if '_public_keys' not in cls.__dict__:
+            #keys are computed when class mapper is configured
+            configure_mappers()
+
+        return cls._public_keys
+
+    @classmethod
+    def serialize_many(cls, rows, as_tuples=False):
+        """Serialize a list of model instances
+
+        By default a list of dicts is returned. When as_tuples is True
+        a list of tuples with field values, ordered as get_public_keys,
+        is returned instead.
+
+        """
+
+        getter = cls._public_getter
+        if as_tuples:
+            return [getter(row) for row in rows]
+
+        keys = cls._public_keys
+
+        return [dict(izip(keys, getter(row))) for row in rows]
+
+
+def _init_public_keys(mapper, cls):
+    """Precompute public field names for an iterable model class"""
+
+    keys = []
+    for column in mapper.columns:
+        key = mapper.get_property_by_column(column).key
         #skip non public properties
-        column = self._col_iter.next()
-        mapper_property = self._mapper.get_property_by_column(column)
-        field_name = mapper_property.key
+        if not key.startswith('_') and key not in keys:
+            keys.append(key)
 
-        while field_name.startswith('_'):
-            column = self._col_iter.next()
-            mapper_property = self._mapper.get_property_by_column(column)
-            field_name = mapper_property.key
+    cls._public_keys = tuple(keys)
+    if len(keys) == 1:
+        #attrgetter returns a value instead of a tuple for a single name
+        getter = attrgetter(keys[0])
+        cls._public_getter = staticmethod(lambda obj: (getter(obj),))
+    elif keys:
+        cls._public_getter = staticmethod(attrgetter(*keys))
 
-        field_value = getattr(self, field_name)
 
-        return (field_name, field_value)
+event.listen(IterableModel, 'mapper_configured', _init_public_keys,
+             propagate=True)
 
 
 class BaseIterableDeclarativeModel(IterableModel, BaseDeclarativeMixIn):
@@ -204,17 +1005,60 @@ IterableDeclarativeModel = declarative_base(name="IterableDeclarativeModel",
                                             metadata=META)
 
 
+def _init_engine_events(engine, name):
+    #record statistics for requests
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'before_cursor_execute', _count_engine_queries(name))
+    _record_pool_checkout(engine.pool)
+
+
 def init_database_engine(config):
-    """Initialize connection to database"""
+    """Initialize connection to database
+
+    Read replicas are created for each group of database.replica.<N>.*
+    options, for example database.replica.1.url.
+
+    """
 
     global ENGINE
+    global REPLICA_STRATEGY
 
-    engine_kwds = {
-        'prefix': u'database.',
-        'convert_unicode': True,
-    }
-    ENGINE = engine_from_config(config.copy(), **engine_kwds)
+    engine_config = dict((key, value) for (key, value) in config.items()
+                         if key[len('database.'):] not in DUENDE_OPTIONS
+                         and not key.startswith(REPLICA_PREFIX))
+    ENGINE = engine_from_config(engine_config, prefix=u'database.',
+                                convert_unicode=True)
     META.bind = ENGINE
+    _init_engine_events(ENGINE, 'primary')
+
+    strategy = config.get('database.replica_strategy', 'round_robin')
+    if strategy not in REPLICA_STRATEGIES:
+        msg = u'Invalid database replica strategy %s' % strategy
+
+        raise DatabaseException(msg)
+
+    REPLICA_STRATEGY = strategy
+
+    replica_numbers = set(key[len(REPLICA_PREFIX):].split('.', 1)[0]
+                          for key in config
+                          if key.startswith(REPLICA_PREFIX))
+    del REPLICAS[:]
+    for number in sorted(replica_numbers):
+        name = 'replica.' + number
+        engine = engine_from_config(config, prefix=u'database.%s.' % name,
+                                    convert_unicode=True)
+        _init_engine_events(engine, name)
+        REPLICAS.append((name, engine))
+        LOG.info(u'Using database read replica %s', name)
+
+    #table generations must be shared by all processes to invalidate
+    #cached queries when tables are changed in other processes
+    cache_type = config.get('cache.type', 'memory')
+    if config.get('cache.regions') and cache_type in cache.PROCESS_CACHE_TYPES:
+        LOG.warning(u'Cache type %s is local to each process, cached '
+                    u'queries are only invalidated by changes made in the '
+                    u'same process', cache_type)
 
 
 def init_database_session():
@@ -222,14 +1066,26 @@ def init_database_session():
 
     global SESSION
 
-    SESSION = scoped_session(sessionmaker())
+    session_factory = sessionmaker(class_=RoutingSession,
+                                   query_cls=CachingQuery)
+    #invalidate cached queries when tables are changed
+    event.listen(session_factory, 'after_flush', _after_flush)
+    event.listen(session_factory, 'after_commit', _after_commit)
+    event.listen(session_factory, 'after_rollback', _after_rollback)
+
+    SESSION = scoped_session(session_factory)
     SESSION.configure(bind=ENGINE)
 
 
 def clean_database_session():
-    """Cleans any pending transactions and return connections to the pool"""
+    """Cleans any pending transactions and return connections to the pool
+
+    Nothing is done when session was not used in current thread.
+
+    """
 
-    SESSION.remove()
+    if SESSION.registry.has():
+        SESSION.remove()
 
 
 def create_all_tables():
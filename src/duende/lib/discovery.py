@@ -0,0 +1,162 @@
+# -*- coding: utf8 -*-
+#
+# Copyright (c) 2011, Jerónimo José Albi <jeronimo.albi@gmail.com>
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of copyright holders nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+# NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+# THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import logging
+import pkgutil
+import time
+
+from paste.util.import_string import import_module
+from paste.util.import_string import try_import_module
+
+LOG = logging.getLogger(__name__)
+
+
+def _raise_import_error(module_name):
+    #pkgutil ignores import errors in packages unless an error handler is used
+    raise
+
+
+def is_view_handler(module, name):
+    """Check if a module attribute can be used as a view handler
+
+    Same rules used by view resolver are applied, so names starting with
+    an underscore and attributes imported from other modules are skipped.
+
+    """
+
+    if name.startswith('_'):
+        return False
+
+    view = getattr(module, name, None)
+    if not view:
+        return False
+
+    return (getattr(view, '__module__', None) == module.__name__)
+
+
+def iter_view_modules(app_name):
+    """Import all view modules of an application
+
+    Generator yields tuples with module path relative to application view
+    package and module instance, like (u'user.admin', <module>).
+
+    """
+
+    package_name = '%s.view' % app_name
+    package = try_import_module(package_name)
+    if not package:
+        LOG.warning(u'Application %s has no view package', app_name)
+
+        return
+
+    prefix = package_name + '.'
+    module_iter = pkgutil.walk_packages(package.__path__, prefix,
+                                        onerror=_raise_import_error)
+    for (loader, module_name, is_package) in module_iter:
+        module = import_module(module_name)
+
+        yield (module_name[len(prefix):], module)
+
+
+def get_module_views(module):
+    """Get a list of (name, view) tuples for views defined in a module"""
+
+    view_list = []
+    for name in sorted(dir(module)):
+        if is_view_handler(module, name):
+            view_list.append((name, getattr(module, name)))
+
+    return view_list
+
+
+def find_app_views(app_name):
+    """Get a list with all views available for an application
+
+    List contains tuples with relative module path, view name and view.
+
+    """
+
+    view_list = []
+    for (module_path, module) in iter_view_modules(app_name):
+        for (name, view) in get_module_views(module):
+            view_list.append((module_path, name, view))
+
+    return view_list
+
+
+class ViewIndex(object):
+    """Read only index of preloaded views
+
+    Views are indexed by (app name, module path, view name) tuples, using
+    same values that ViewResolverMiddleware gets from request URLs.
+
+    """
+
+    def __init__(self, views, module_count=0, load_time=0.0):
+        self._views = dict(views)
+        self.module_count = module_count
+        self.load_time = load_time
+
+    def __len__(self):
+        return len(self._views)
+
+    def __iter__(self):
+        return iter(self._views)
+
+    def __contains__(self, key):
+        return key in self._views
+
+    def get(self, key, default=None):
+        return self._views.get(key, default)
+
+
+def preload_views(app_list):
+    """Import all view modules for a list of applications
+
+    Return a ViewIndex with all views found.
+
+    """
+
+    start_time = time.time()
+    views = {}
+    module_count = 0
+    for app_name in app_list:
+        for (module_path, module) in iter_view_modules(app_name):
+            module_count += 1
+            for (name, view) in get_module_views(module):
+                views[(app_name, module_path, name)] = view
+
+    load_time = time.time() - start_time
+    view_index = ViewIndex(views, module_count=module_count,
+                           load_time=load_time)
+    LOG.info(u'Preloaded %d views from %d modules in %.3f seconds',
+             len(view_index), module_count, load_time)
+
+    return view_index
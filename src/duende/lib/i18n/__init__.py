@@ -30,6 +30,14 @@
 
 #Locale reference: http://babel.edgewall.org/wiki/Documentation/display.html
 from babel import Locale
+from babel import UnknownLocaleError
+
+from duende import REQUEST
+from duende.lib.cache import LRUCache
+from duende.lib.config import CONFIG
+
+#formatters for each locale and format
+FORMATTERS = LRUCache(1000)
 
 
 def locale_to_posix(locale):
@@ -88,3 +96,99 @@ def get_http_locales(accept_language, default='en_US'):
             return locale_codes
 
     return [default]
+
+
+def parse_locale(code):
+    """Get a babel Locale for a locale code, or None when code is unknown"""
+
+    try:
+        return Locale.parse(code)
+    except (UnknownLocaleError, ValueError):
+        return
+
+
+class LocaleNegotiator(object):
+    """Resolve request locales from HTTP Accept-Language headers
+
+    Only locales that are available are considered when available
+    locales are given. A locale is available when it or its language
+    is in available locales.
+    Results are cached for each Accept-Language header value.
+
+    """
+
+    def __init__(self, default='en_US', available=None, cache_size=1000):
+        self.default = locale_to_posix(default)
+        self.available = frozenset(available or ())
+        self._cache = LRUCache(cache_size)
+
+    def is_available(self, locale_code):
+        if not self.available:
+            return True
+
+        if locale_code in self.available:
+            return True
+
+        language = locale_code.split('_')[0]
+
+        return (language in self.available)
+
+    def _negotiate(self, accept_language):
+        locale_list = get_http_locales(accept_language, default=self.default)
+        locale_list = [locale_code for locale_code in locale_list
+                       if locale_code == self.default
+                       or self.is_available(locale_code)]
+
+        locale = None
+        for locale_code in locale_list:
+            locale = parse_locale(locale_code)
+            if locale:
+                break
+
+        return (locale_list, locale)
+
+    def negotiate(self, accept_language):
+        """Get a tuple with request locale list and babel locale
+
+        Locale list contains posix locale and language codes sorted by
+        preference. Babel locale is None when no locale code is known.
+
+        """
+
+        result = self._cache.get(accept_language)
+        if result is None:
+            result = self._negotiate(accept_language)
+            self._cache.set(accept_language, result)
+
+        return result
+
+
+def get_current_locale():
+    """Get babel Locale for current request
+
+    When request has no locale default locale is used.
+
+    """
+
+    locale = REQUEST.environ.get('duende.locale')
+    if locale is None:
+        locale = Locale.parse(CONFIG.get('default_locale', 'en_US'))
+
+    return locale
+
+
+def get_formatter(formatter_class, locale, format):
+    """Get a cached formatter instance for a locale and format
+
+    Formatter class is called with locale and format as arguments
+    the first time a formatter is needed.
+
+    """
+
+    key = (formatter_class, unicode(locale), format)
+    formatter = FORMATTERS.get(key)
+    if formatter is None:
+        formatter = formatter_class(locale, format)
+        FORMATTERS.set(key, formatter)
+
+    return formatter
@@ -0,0 +1,280 @@
+# -*- coding: utf8 -*-
+#
+# Copyright (c) 2011, Jerónimo José Albi <jeronimo.albi@gmail.com>
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of copyright holders nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+# NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+# THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import os
+import copy
+import mmap
+import zlib
+import struct
+import gettext as _gettext
+
+from threading import Lock
+
+from babel.messages.mofile import read_mo
+
+CATALOG_MAGIC = 'DCT1'
+#file extension for compact catalogs
+CATALOG_EXTENSION = '.cat'
+#magic, number of index slots, plural expression offset and length
+HEADER = struct.Struct('!4sIII')
+#key hash, key offset, key length, value offset and value length
+SLOT = struct.Struct('!IIIII')
+#prefix for keys of plural messages
+PLURAL_PREFIX = '\x01'
+#separator for message context and for plural form values
+CONTEXT_SEPARATOR = '\x04'
+PLURAL_SEPARATOR = '\x00'
+
+#loaded catalogs are shared by all translation managers
+_CATALOGS = {}
+_CATALOGS_LOCK = Lock()
+
+
+def get_key_hash(key):
+    return zlib.crc32(key) & 0xffffffff
+
+
+def _encode_message_key(message):
+    if isinstance(message.id, (list, tuple)):
+        key = PLURAL_PREFIX + message.id[0].encode('utf8')
+        value = PLURAL_SEPARATOR.join(string.encode('utf8')
+                                      for string in message.string)
+    else:
+        key = message.id.encode('utf8')
+        value = message.string.encode('utf8')
+
+    if message.context:
+        key = message.context.encode('utf8') + CONTEXT_SEPARATOR + key
+
+    return (key, value)
+
+
+def write_catalog(mo_file_name, file_name):
+    """Convert a gettext .mo file to a compact catalog file
+
+    Catalog file has a header, a hash index with open addressing and
+    the UTF-8 encoded keys and values of all translated messages.
+
+    """
+
+    with open(mo_file_name, 'rb') as mo_file:
+        catalog = read_mo(mo_file)
+
+    entries = []
+    for message in catalog:
+        if not message.id or not message.string:
+            continue
+
+        if isinstance(message.string, (list, tuple)):
+            if not all(message.string):
+                continue
+
+        entries.append(_encode_message_key(message))
+
+    #index size is a power of two with at least half of the slots empty
+    slot_count = 8
+    while slot_count < len(entries) * 2:
+        slot_count *= 2
+
+    plural_expr = (catalog.plural_expr or '').encode('utf8')
+    data_offset = HEADER.size + SLOT.size * slot_count
+    slots = [None] * slot_count
+    data = [plural_expr]
+    offset = data_offset + len(plural_expr)
+    for (key, value) in entries:
+        key_hash = get_key_hash(key)
+        index = key_hash & (slot_count - 1)
+        while slots[index] is not None:
+            index = (index + 1) & (slot_count - 1)
+
+        value_offset = offset + len(key)
+        slots[index] = (key_hash, offset, len(key), value_offset, len(value))
+        data.append(key)
+        data.append(value)
+        offset = value_offset + len(value)
+
+    empty_slot = SLOT.pack(0, 0, 0, 0, 0)
+    #write to a temporary file to replace catalog atomically
+    tmp_file_name = file_name + '.tmp'
+    with open(tmp_file_name, 'wb') as cat_file:
+        cat_file.write(HEADER.pack(CATALOG_MAGIC, slot_count, data_offset,
+                                   len(plural_expr)))
+        for slot in slots:
+            cat_file.write(SLOT.pack(*slot) if slot else empty_slot)
+
+        cat_file.write(''.join(data))
+
+    os.rename(tmp_file_name, file_name)
+
+    return len(entries)
+
+
+class CatalogTranslations(_gettext.NullTranslations):
+    """Translations that are read from a memory mapped compact catalog
+
+    Messages are searched in catalog index for each translation, so
+    no dictionary is created for catalog messages.
+
+    """
+
+    def __init__(self, file_name):
+        _gettext.NullTranslations.__init__(self)
+        self.file_name = file_name
+        with open(file_name, 'rb') as cat_file:
+            self._map = mmap.mmap(cat_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+
+        (magic, slot_count, plural_offset, plural_length) = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != CATALOG_MAGIC:
+            raise IOError(u'Invalid catalog file %s' % file_name)
+
+        self._mask = slot_count - 1
+        plural_expr = self._map[plural_offset:plural_offset + plural_length]
+        if plural_expr:
+            self.plural = _gettext.c2py(plural_expr)
+        else:
+            self.plural = lambda num: int(num != 1)
+
+    def _lookup(self, key):
+        key_hash = get_key_hash(key)
+        index = key_hash & self._mask
+        while True:
+            slot = SLOT.unpack_from(self._map, HEADER.size + SLOT.size * index)
+            (slot_hash, key_offset, key_length, value_offset, value_length) \
+                = slot
+            if not key_offset:
+                return
+
+            if slot_hash == key_hash and key_length == len(key):
+                if self._map[key_offset:key_offset + key_length] == key:
+                    return self._map[value_offset:value_offset + value_length]
+
+            index = (index + 1) & self._mask
+
+    def ugettext(self, message):
+        if isinstance(message, unicode):
+            key = message.encode('utf8')
+        else:
+            key = message
+
+        value = self._lookup(key)
+        if value is None:
+            if self._fallback:
+                return self._fallback.ugettext(message)
+
+            return unicode(message)
+
+        return value.decode('utf8')
+
+    def ungettext(self, msgid1, msgid2, num):
+        if isinstance(msgid1, unicode):
+            key = PLURAL_PREFIX + msgid1.encode('utf8')
+        else:
+            key = PLURAL_PREFIX + msgid1
+
+        value = self._lookup(key)
+        if value is None:
+            if self._fallback:
+                return self._fallback.ungettext(msgid1, msgid2, num)
+
+            return unicode(msgid1 if num == 1 else msgid2)
+
+        plural_list = value.split(PLURAL_SEPARATOR)
+        index = self.plural(num)
+
+        return plural_list[min(index, len(plural_list) - 1)].decode('utf8')
+
+    def gettext(self, message):
+        return self.ugettext(message).encode('utf8')
+
+    def ngettext(self, msgid1, msgid2, num):
+        return self.ungettext(msgid1, msgid2, num).encode('utf8')
+
+
+def get_catalog_file_name(locale_dir, language, domain):
+    file_name = domain + CATALOG_EXTENSION
+
+    return os.sep.join([locale_dir, language, 'LC_MESSAGES', file_name])
+
+
+def translation(domain, locale_dir, languages):
+    """Get translations for a domain using compact catalogs
+
+    Works like gettext.translation. Catalogs for other languages in
+    list are used as fallbacks, and an IOError is raised when no
+    catalog file is found.
+
+    """
+
+    result = None
+    for language in languages:
+        file_name = get_catalog_file_name(locale_dir, language, domain)
+        with _CATALOGS_LOCK:
+            catalog = _CATALOGS.get(file_name)
+            if catalog is None:
+                if not os.path.isfile(file_name):
+                    continue
+
+                catalog = _CATALOGS[file_name] = CatalogTranslations(file_name)
+
+        #copy catalog so fallbacks are not shared
+        catalog = copy.copy(catalog)
+        if result is None:
+            result = catalog
+        else:
+            result.add_fallback(catalog)
+
+    if result is None:
+        msg = u'No catalog file found for domain: %s' % domain
+
+        raise IOError(msg)
+
+    return result
+
+
+def compile_catalogs(domain, locale_dir):
+    """Create compact catalogs for all domain .mo files in a locale directory
+
+    Return a list of (language, number of messages) tuples.
+
+    """
+
+    result = []
+    for language in sorted(os.listdir(locale_dir)):
+        messages_dir = os.sep.join([locale_dir, language, 'LC_MESSAGES'])
+        mo_file_name = os.sep.join([messages_dir, domain + '.mo'])
+        if not os.path.isfile(mo_file_name):
+            continue
+
+        file_name = get_catalog_file_name(locale_dir, language, domain)
+        message_count = write_catalog(mo_file_name, file_name)
+        result.append((language, message_count))
+
+    return result
@@ -28,22 +28,32 @@
 # THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
-from babel.dates import format_date as _format_date
-from babel.dates import format_datetime as _format_datetime
-from babel.dates import format_time as _format_time
+from datetime import date as date_type
+from datetime import datetime as datetime_type
+from datetime import time as time_type
 
-from duende import REQUEST
+from babel import Locale
+from babel.dates import UTC
+from babel.dates import get_date_format
+from babel.dates import get_datetime_format
+from babel.dates import get_time_format
+from babel.dates import parse_pattern
+
+from duende.lib.i18n import get_current_locale
+from duende.lib.i18n import get_formatter
 
 SHORT = 'short'
-MEDIUM = 'madium'
+MEDIUM = 'medium'
 LONG = 'long'
 FULL = 'full'
 
+FORMATS = (SHORT, MEDIUM, LONG, FULL)
+
 
 def get_current_locale_code():
     """Get locale code for current request"""
 
-    locale = REQUEST['duende.locale']
+    locale = get_current_locale()
 
     if not locale.territory:
         return locale.language
@@ -51,15 +61,110 @@ def get_current_locale_code():
     return '%s_%s' % (locale.language, locale.territory)
 
 
+class DateFormatter(object):
+    """Date formatter for a locale and a format
+
+    Format can be one of short, medium, long and full or a date pattern.
+    Pattern is parsed only once when formatter is created.
+    Empty values are returned without formatting.
+
+    """
+
+    def __init__(self, locale, format=MEDIUM):
+        self.locale = Locale.parse(locale)
+        self.format = format
+        self.pattern = self._get_pattern(format)
+
+    def _get_pattern(self, format):
+        if format in FORMATS:
+            format = get_date_format(format, locale=self.locale)
+
+        return parse_pattern(format)
+
+    def _format(self, value):
+        if isinstance(value, datetime_type):
+            value = value.date()
+
+        return self.pattern.apply(value, self.locale)
+
+    def __call__(self, value):
+        if not value:
+            return value
+
+        return self._format(value)
+
+    def format_many(self, values):
+        """Get a list with all values formatted"""
+
+        format = self._format
+
+        return [(format(value) if value else value) for value in values]
+
+
+class TimeFormatter(DateFormatter):
+    """Time formatter for a locale and a format"""
+
+    def _get_pattern(self, format):
+        if format in FORMATS:
+            format = get_time_format(format, locale=self.locale)
+
+        return parse_pattern(format)
+
+    def _format(self, value):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=UTC)
+
+        if isinstance(value, datetime_type):
+            value = value.timetz()
+
+        return self.pattern.apply(value, self.locale)
+
+
+class DateTimeFormatter(DateFormatter):
+    """Datetime formatter for a locale and a format"""
+
+    def __init__(self, locale, format=MEDIUM):
+        self.locale = Locale.parse(locale)
+        self.format = format
+        if format in FORMATS:
+            #standard formats combine date and time patterns
+            datetime_format = get_datetime_format(format, locale=self.locale)
+            self.datetime_format = datetime_format.replace("'", "")
+            self.date_formatter = DateFormatter(self.locale, format)
+            self.time_formatter = TimeFormatter(self.locale, format)
+            self.pattern = None
+        else:
+            self.datetime_format = None
+            self.pattern = parse_pattern(format)
+
+    def _format(self, value):
+        if isinstance(value, time_type):
+            value = datetime_type.combine(date_type.today(), value)
+        elif not isinstance(value, datetime_type):
+            value = datetime_type.combine(value, time_type())
+
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=UTC)
+
+        if not self.datetime_format:
+            return self.pattern.apply(value, self.locale)
+
+        time_text = self.time_formatter._format(value)
+        date_text = self.date_formatter._format(value)
+
+        return self.datetime_format.replace('{0}', time_text) \
+                                   .replace('{1}', date_text)
+
+
 def format_date(date, format=MEDIUM):
     """Format date using current locale"""
 
     if not date:
         return date
 
-    locale = get_current_locale_code()
+    formatter = get_formatter(DateFormatter, get_current_locale(), format)
 
-    return _format_date(date, format=format, locale=locale)
+    return formatter(date)
 
 
 def format_time(time, format=MEDIUM):
@@ -68,9 +173,9 @@ def format_time(time, format=MEDIUM):
     if not time:
         return time
 
-    locale = get_current_locale_code()
+    formatter = get_formatter(TimeFormatter, get_current_locale(), format)
 
-    return _format_time(time, format=format, locale=locale)
+    return formatter(time)
 
 
 def format_datetime(datetime, format=MEDIUM):
@@ -79,6 +184,30 @@ def format_datetime(datetime, format=MEDIUM):
     if not datetime:
         return datetime
 
-    locale = get_current_locale_code()
+    formatter = get_formatter(DateTimeFormatter, get_current_locale(), format)
+
+    return formatter(datetime)
+
+
+def format_dates(dates, format=MEDIUM):
+    """Format a list of dates using current locale"""
+
+    formatter = get_formatter(DateFormatter, get_current_locale(), format)
+
+    return formatter.format_many(dates)
+
+
+def format_times(times, format=MEDIUM):
+    """Format a list of times using current locale"""
+
+    formatter = get_formatter(TimeFormatter, get_current_locale(), format)
+
+    return formatter.format_many(times)
+
+
+def format_datetimes(datetimes, format=MEDIUM):
+    """Format a list of datetimes using current locale"""
+
+    formatter = get_formatter(DateTimeFormatter, get_current_locale(), format)
 
-    return _format_datetime(datetime, format=format, locale=locale)
+    return formatter.format_many(datetimes)
@@ -0,0 +1,205 @@
+# -*- coding: utf8 -*-
+#
+# Copyright (c) 2011, Jerónimo José Albi <jeronimo.albi@gmail.com>
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of copyright holders nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+# NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+# THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import os
+import re
+import hashlib
+import logging
+
+from jinja2.utils import contextfunction
+from babel.messages.mofile import read_mo
+
+from duende import REQUEST
+from duende import Response
+from duende import httpexc
+from duende.lib import urls
+from duende.lib.cache import LRUCache
+from duende.lib.config import CONFIG
+from duende.lib.i18n import translation
+from duende.lib.jsonrpc import simplejson_dumps
+from duende.lib.view import public
+
+LOG = logging.getLogger(__name__)
+
+#default URL where catalog view is mapped in urls.ini
+CATALOG_URL = '/_i18n/catalog.json'
+#seconds to cache catalogs with a version hash in URL
+CATALOG_MAX_AGE = 365 * 24 * 60 * 60
+#valid locale codes for catalog requests
+LOCALE_RE = re.compile(r'^[a-zA-Z]{2,3}(_[a-zA-Z0-9]{2,8})?$')
+
+#generated catalogs for each application and locale
+CATALOGS = LRUCache(100)
+
+
+class JSCatalog(object):
+    """JSON translation catalog for an application and a locale
+
+    Catalog contains all translated messages for locale languages.
+    Plural messages are translated to a list of plural forms.
+
+    """
+
+    def __init__(self, app_name, locale):
+        self.app_name = app_name
+        self.locale = locale
+        (messages, plural_expr) = self._read_messages()
+        data = {
+            'domain': app_name,
+            'locale': locale,
+            'plural': plural_expr,
+            'messages': messages,
+        }
+        self.body = simplejson_dumps(data, compact_mode=True)
+        self.hash = hashlib.sha1(self.body).hexdigest()[:16]
+
+    def _read_messages(self):
+        locale_dir = translation.get_translation_domains().get(self.app_name)
+        if not locale_dir:
+            return ({}, None)
+
+        manager = translation.get_translation_manager([self.locale])
+        messages = {}
+        plural_expr = None
+        #messages from preferred languages replace fallback ones
+        for language in reversed(manager.languages):
+            file_name = os.sep.join([locale_dir, language, 'LC_MESSAGES',
+                                     self.app_name + '.mo'])
+            if not os.path.isfile(file_name):
+                continue
+
+            with open(file_name, 'rb') as mo_file:
+                catalog = read_mo(mo_file)
+
+            plural_expr = catalog.plural_expr
+            for message in catalog:
+                if not message.id or not message.string:
+                    continue
+
+                if isinstance(message.id, (list, tuple)):
+                    (key, value) = (message.id[0], list(message.string))
+                else:
+                    (key, value) = (message.id, message.string)
+
+                #use gettext convention for messages with context
+                if message.context:
+                    key = u'%s\x04%s' % (message.context, key)
+
+                messages[key] = value
+
+        return (messages, plural_expr)
+
+
+def get_catalog(app_name, locale):
+    """Get JSCatalog for an application and locale
+
+    Catalogs are generated only the first time they are requested.
+
+    """
+
+    key = (app_name, locale)
+    catalog = CATALOGS.get(key)
+    if catalog is None:
+        LOG.debug(u'Creating JS catalog for %s %s', app_name, locale)
+        catalog = JSCatalog(app_name, locale)
+        CATALOGS.set(key, catalog)
+
+    return catalog
+
+
+def get_catalog_url(app_name, locale):
+    """Get URL for an application catalog including catalog hash"""
+
+    base_url = CONFIG.get('i18n.js_catalog_url', CATALOG_URL)
+    catalog = get_catalog(app_name, locale)
+    params = {
+        'app': app_name,
+        'locale': locale,
+        'v': catalog.hash,
+    }
+
+    return urls.url_apply(urls.url(base_url), params)
+
+
+@contextfunction
+def catalog_url(context, app_name=None):
+    """Template function to get catalog URL for current request locale
+
+    By default catalog for current template application is used.
+
+    Usage:
+
+        <script src="{{ catalog_url() }}"></script>
+
+    """
+
+    if not app_name:
+        app_name = context.name.split('/')[0]
+
+    manager = REQUEST.environ['duende.translation']
+
+    return get_catalog_url(app_name, manager.locale_list[0])
+
+
+@public
+def catalog(request):
+    """View that serves JSON translation catalogs
+
+    Add it to application urls.ini [resources] section to use it:
+
+        _i18n/catalog.json = call:duende.lib.i18n.jscatalog#catalog
+
+    Catalogs are cached by clients forever when URL has current
+    catalog version hash.
+
+    """
+
+    app_name = request.GET.get('app')
+    locale = request.GET.get('locale', '')
+    if app_name not in translation.get_translation_domains():
+        raise httpexc.HTTPNotFound()
+
+    if not LOCALE_RE.match(locale):
+        raise httpexc.HTTPNotFound()
+
+    catalog = get_catalog(app_name, str(locale))
+    response = Response()
+    response.content_type = 'application/json'
+    response.charset = 'utf-8'
+    response.body = catalog.body
+    response.etag = catalog.hash
+    response.conditional_response = True
+    if request.GET.get('v') == catalog.hash:
+        response.cache_control.public = True
+        response.cache_control.max_age = CATALOG_MAX_AGE
+    else:
+        #clients must check for changes when URL has no valid hash
+        response.cache_control.no_cache = True
+
+    return response
@@ -0,0 +1,86 @@
+# -*- coding: utf8 -*-
+#
+# Copyright (c) 2011, Jerónimo José Albi <jeronimo.albi@gmail.com>
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of copyright holders nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+# NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+# THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+from babel import Locale
+from babel.numbers import parse_pattern
+
+from duende.lib.i18n import get_current_locale
+from duende.lib.i18n import get_formatter
+
+
+class NumberFormatter(object):
+    """Number formatter for a locale and a format
+
+    When no format is given locale decimal format is used.
+    Pattern is parsed only once when formatter is created.
+    None values are returned without formatting.
+
+    """
+
+    def __init__(self, locale, format=None):
+        self.locale = Locale.parse(locale)
+        self.format = format
+        if not format:
+            format = self.locale.decimal_formats.get(None)
+
+        self.pattern = parse_pattern(format)
+
+    def __call__(self, value):
+        if value is None:
+            return value
+
+        return self.pattern.apply(value, self.locale)
+
+    def format_many(self, values):
+        """Get a list with all values formatted"""
+
+        apply = self.pattern.apply
+        locale = self.locale
+
+        return [(apply(value, locale) if value is not None else value)
+                for value in values]
+
+
+def format_number(number, format=None):
+    """Format a number using current locale"""
+
+    if number is None:
+        return number
+
+    formatter = get_formatter(NumberFormatter, get_current_locale(), format)
+
+    return formatter(number)
+
+
+def format_numbers(numbers, format=None):
+    """Format a list of numbers using current locale"""
+
+    formatter = get_formatter(NumberFormatter, get_current_locale(), format)
+
+    return formatter.format_many(numbers)
@@ -29,13 +29,28 @@
 #
 
 import os
+import hashlib
+import logging
 import gettext as _gettext
 
 from functools import partial
 
+from paste.deploy.converters import asbool
+from paste.deploy.converters import asint
+
 from duende import REQUEST
-from duende import get_enabled_app_list
-from duende.lib.resource import get_resource_dir
+from duende.lib.cache import LRUCache
+from duende.lib.i18n import catalog
+from duende.lib.registry import get_app_registry
+
+LOG = logging.getLogger(__name__)
+
+#map of application names to application locale directories
+DOMAINS = None
+#translation managers for each request locale list
+MANAGERS = None
+#when true translations are loaded from compact catalog files
+COMPACT_CATALOGS = False
 
 
 class TranslationManagerError(Exception):
@@ -49,7 +64,8 @@ class TranslationManager(object):
         self.locale_list = locale_list
         #TODO: Check if there is no need to add languages
         self.languages = self._parse_languages_in_locale_list()
-        self._init_application_domains()
+        self.domains = get_translation_domains()
+        self.translations = {}
 
     def _parse_languages_in_locale_list(self):
         """Create a list of locales and languages for missing locale languages
@@ -77,40 +93,56 @@ class TranslationManager(object):
 
         return languages
 
-    def _init_application_domains(self):
-        self.domains = {}
-        for app_name in get_enabled_app_list():
-            resource_dir = get_resource_dir(app_name)
-            if not resource_dir:
-                continue
-
-            locale_dir = os.sep.join([resource_dir, 'locale'])
-            if not os.path.isdir(locale_dir):
-                continue
-
-            #map a domain to a locale directory.
-            #template location will be resolvedi using something
-            #like "app_name/path_to/template.xxx" for renderers
-            self.domains[app_name] = {
-                'locale_dir': locale_dir,
-                'translation': None,
-            }
-
     def get_translation(self, domain):
-        domain_info = self.domains.get(domain, None)
-        if not domain_info:
+        translation = self.translations.get(domain)
+        if translation:
+            return translation
+
+        locale_dir = self.domains.get(domain)
+        if not locale_dir:
             msg = u'Invalid translation domain %s' % domain
 
             raise TranslationManagerError(msg)
 
-        #create translation when is missing
-        if not domain_info['translation']:
-            locale_dir = domain_info['locale_dir']
-            langs = self.languages
-            trans = _gettext.translation(domain, locale_dir, languages=langs)
-            domain_info['translation'] = trans
+        #managers are shared between requests, so translation
+        #is created only the first time a domain is used
+        langs = self.languages
+        if COMPACT_CATALOGS:
+            translation = catalog.translation(domain, locale_dir, langs)
+        else:
+            translation = _gettext.translation(domain, locale_dir,
+                                               languages=langs)
+
+        self.translations[domain] = translation
 
-        return domain_info['translation']
+        return translation
+
+    def get_catalog_fingerprint(self):
+        """Get a hash that changes when any domain catalog file changes
+
+        Hash uses names, sizes and modification times of catalog files
+        for manager languages.
+
+        """
+
+        file_stats = []
+        for (domain, locale_dir) in sorted(self.domains.items()):
+            if COMPACT_CATALOGS:
+                file_names = [catalog.get_catalog_file_name(locale_dir,
+                                                            language, domain)
+                              for language in self.languages]
+            else:
+                file_names = _gettext.find(domain, locale_dir,
+                                           languages=self.languages,
+                                           all=True)
+
+            for file_name in file_names:
+                if os.path.isfile(file_name):
+                    stat = os.stat(file_name)
+                    file_stats.append((file_name, stat.st_size,
+                                       stat.st_mtime))
+
+        return hashlib.sha1(repr(file_stats)).hexdigest()
 
     def gettext(self, domain, message):
         translation = self.get_translation(domain)
@@ -123,6 +155,99 @@ class TranslationManager(object):
         return translation.ungettext(message, plural_message, count)
 
 
+def find_translation_domains():
+    """Get a dictionary with locale directories for enabled applications
+
+    Dictionary keys are application names, which are used as domains.
+
+    """
+
+    domains = {}
+    for app_info in get_app_registry():
+        if not app_info.locale_dir:
+            continue
+
+        #map a domain to a locale directory.
+        #template location will be resolvedi using something
+        #like "app_name/path_to/template.xxx" for renderers
+        domains[app_info.name] = app_info.locale_dir
+
+    return domains
+
+
+def get_translation_domains():
+    """Get a dictionary with locale directories for enabled applications
+
+    Domains are searched only once.
+
+    """
+
+    global DOMAINS
+
+    if DOMAINS is None:
+        DOMAINS = find_translation_domains()
+
+    return DOMAINS
+
+
+def get_available_locales():
+    """Get a set with locale codes with translations in enabled applications"""
+
+    locales = set()
+    for (domain, locale_dir) in get_translation_domains().iteritems():
+        for locale_code in os.listdir(locale_dir):
+            file_name = os.sep.join([locale_dir, locale_code, 'LC_MESSAGES',
+                                     domain])
+            if COMPACT_CATALOGS:
+                file_name += catalog.CATALOG_EXTENSION
+            else:
+                file_name += '.mo'
+
+            if os.path.isfile(file_name):
+                locales.add(locale_code)
+
+    return locales
+
+
+def init_translations(config):
+    """Initialize translation domains and translation managers cache
+
+    Config value i18n.cache_size sets the number of translation
+    managers to keep in memory, and i18n.compact_catalogs enables
+    loading translations from catalogs created using
+    duende_compile_catalogs command.
+
+    """
+
+    global DOMAINS
+    global MANAGERS
+    global COMPACT_CATALOGS
+
+    DOMAINS = find_translation_domains()
+    LOG.debug(u'Translation domains: %s', u', '.join(sorted(DOMAINS)))
+    MANAGERS = LRUCache(asint(config.get('i18n.cache_size', 100)))
+    COMPACT_CATALOGS = asbool(config.get('i18n.compact_catalogs'))
+
+
+def get_translation_manager(locale_list):
+    """Get a TranslationManager for a list of locales
+
+    Managers are cached when translations are initialized.
+
+    """
+
+    if MANAGERS is None:
+        return TranslationManager(locale_list)
+
+    key = tuple(locale_list)
+    manager = MANAGERS.get(key)
+    if manager is None:
+        manager = TranslationManager(list(locale_list))
+        MANAGERS.set(key, manager)
+
+    return manager
+
+
 def get_current_translation_manager():
     """Get TranslationManager for current request"""
 
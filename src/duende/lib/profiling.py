@@ -0,0 +1,198 @@
+# -*- coding: utf8 -*-
+#
+# Copyright (c) 2011, Jerónimo José Albi <jeronimo.albi@gmail.com>
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of copyright holders nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+# NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+# THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+from bisect import bisect_left
+from threading import Lock
+from threading import local
+
+#upper limits in milliseconds for histogram buckets
+HISTOGRAM_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class Timing(object):
+    """Timing statistics for a single name
+
+    Times are saved in seconds. Child time is the time spent in children
+    (for example included templates), and macro time the time spent in
+    called macros. Both are part of total time.
+
+    """
+
+    __slots__ = ('name', 'count', 'total', 'child', 'macro', 'min', 'max',
+                 'size', 'histogram')
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.child = 0.0
+        self.macro = 0.0
+        self.min = None
+        self.max = 0.0
+        self.size = 0
+        self.histogram = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+
+    @property
+    def own(self):
+        """Time spent in the timed item itself"""
+
+        return self.total - self.child - self.macro
+
+    @property
+    def average(self):
+        return (self.total / self.count if self.count else 0.0)
+
+    def add(self, duration, size=0, child=0.0, macro=0.0):
+        self.count += 1
+        self.total += duration
+        self.child += child
+        self.macro += macro
+        self.size += size
+        if self.min is None or duration < self.min:
+            self.min = duration
+
+        if duration > self.max:
+            self.max = duration
+
+        bucket = bisect_left(HISTOGRAM_BUCKETS, duration * 1000)
+        self.histogram[bucket] += 1
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'count': self.count,
+            'total': self.total,
+            'own': self.own,
+            'child': self.child,
+            'macro': self.macro,
+            'average': self.average,
+            'min': self.min or 0.0,
+            'max': self.max,
+            'size': self.size,
+            'histogram': list(self.histogram),
+        }
+
+
+class TimingRegistry(object):
+    """Process local registry for timing statistics"""
+
+    def __init__(self):
+        self._timings = {}
+        self._lock = Lock()
+
+    def add(self, name, duration, size=0, child=0.0, macro=0.0):
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = Timing(name)
+
+            timing.add(duration, size=size, child=child, macro=macro)
+
+    def get(self, name):
+        """Get timing statistics dictionary for a name, or None"""
+
+        with self._lock:
+            timing = self._timings.get(name)
+            return (timing.as_dict() if timing else None)
+
+    def get_top(self, count=None, key='total'):
+        """Get a list with timing statistics dictionaries
+
+        List is sorted in descending order using given dictionary key.
+
+        """
+
+        with self._lock:
+            stats_list = [timing.as_dict()
+                          for timing in self._timings.itervalues()]
+
+        stats_list.sort(key=lambda stats: stats[key], reverse=True)
+
+        return (stats_list[:count] if count else stats_list)
+
+    def clear(self):
+        with self._lock:
+            self._timings.clear()
+
+    def __len__(self):
+        return len(self._timings)
+
+
+class TimingStack(local):
+    """Thread local stack of running timers
+
+    Each item is a list with [child time, macro time] of a running timer,
+    so nested timers can add their duration to the timer that called them.
+
+    """
+
+    def __init__(self):
+        self.items = []
+
+    def push(self):
+        item = [0.0, 0.0]
+        self.items.append(item)
+
+        return item
+
+    def pop(self, duration, is_macro=False):
+        self.items.pop()
+        if self.items:
+            self.items[-1][int(is_macro)] += duration
+
+
+def format_timings(stats_list, title=None):
+    """Get a unicode table for a list of timing statistics dictionaries"""
+
+    lines = []
+    if title:
+        lines.append(title)
+        lines.append(u'=' * len(title))
+
+    header = (u'%10s %10s %10s %10s %10s %10s %12s  %s'
+              % (u'calls', u'total ms', u'own ms', u'child ms', u'macro ms',
+                 u'max ms', u'bytes', u'name'))
+    lines.append(header)
+    for stats in stats_list:
+        line = (u'%10d %10.2f %10.2f %10.2f %10.2f %10.2f %12d  %s'
+                % (stats['count'], stats['total'] * 1000,
+                   stats['own'] * 1000, stats['child'] * 1000,
+                   stats['macro'] * 1000, stats['max'] * 1000,
+                   stats['size'], stats['name']))
+        lines.append(line)
+
+    buckets = u', '.join(u'<%dms' % limit for limit in HISTOGRAM_BUCKETS)
+    lines.append(u'')
+    lines.append(u'Histogram buckets: %s, more' % buckets)
+    for stats in stats_list:
+        histogram = u' '.join(unicode(num) for num in stats['histogram'])
+        lines.append(u'%s: %s' % (stats['name'], histogram))
+
+    return u'\n'.join(lines) + u'\n'
@@ -0,0 +1,197 @@
+# -*- coding: utf8 -*-
+#
+# Copyright (c) 2011, Jerónimo José Albi <jeronimo.albi@gmail.com>
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of copyright holders nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+# NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+# THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import os
+import logging
+import pkg_resources
+
+from collections import namedtuple
+
+LOG = logging.getLogger(__name__)
+
+#global registry with enabled applications information
+REGISTRY = None
+
+#installed distributions for each application name
+_DISTRIBUTIONS = {}
+
+
+class AppRegistryException(Exception):
+    pass
+
+
+class AppInfo(namedtuple('AppInfo', ['name', 'base_url', 'version',
+                                     'location', 'resource_dir',
+                                     'static_dir', 'locale_dir',
+                                     'template_dir'])):
+    """Information for an enabled application
+
+    Directories that don't exist are None.
+
+    """
+
+    __slots__ = ()
+
+
+def get_distribution(app_name):
+    """Get installed distribution for an application or None
+
+    Distributions are searched only once for each application.
+
+    """
+
+    if app_name not in _DISTRIBUTIONS:
+        try:
+            dist = pkg_resources.get_distribution(app_name)
+        except pkg_resources.DistributionNotFound:
+            dist = None
+
+        _DISTRIBUTIONS[app_name] = dist
+
+    return _DISTRIBUTIONS[app_name]
+
+
+def find_resource_dir(app_name):
+    """Find directory where application resource files are located."""
+
+    dist = get_distribution(app_name)
+    if not dist:
+        #application is not installed so no resource is available
+        return
+
+    #for namespaced applications replace dot by directory separator
+    #to allow concatenation to access resources directory
+    app_path = app_name.replace('.', os.sep)
+    dir = os.sep.join([dist.location, app_path, 'resources'])
+    if os.path.isdir(dir):
+        return dir
+
+
+def _get_resource_subdir(resource_dir, name):
+    if not resource_dir:
+        return
+
+    dir = os.sep.join([resource_dir, name])
+    if os.path.isdir(dir):
+        return dir
+
+
+def create_app_info(app_name, base_url):
+    dist = get_distribution(app_name)
+    resource_dir = find_resource_dir(app_name)
+
+    return AppInfo(
+        name=app_name,
+        base_url=base_url,
+        version=(dist.version if dist else None),
+        location=(dist.location if dist else None),
+        resource_dir=resource_dir,
+        static_dir=_get_resource_subdir(resource_dir, 'static'),
+        locale_dir=_get_resource_subdir(resource_dir, 'locale'),
+        template_dir=_get_resource_subdir(resource_dir, 'templates'),
+    )
+
+
+class AppRegistry(object):
+    """Registry with information of all enabled applications
+
+    Registry is created once when application starts and
+    must not be changed.
+
+    """
+
+    def __init__(self, url_mapping):
+        apps = {}
+        url_app_mapping = {}
+        for (app_name, base_url) in url_mapping.iteritems():
+            apps[app_name] = create_app_info(app_name, base_url)
+            url_app_mapping[app_name] = base_url
+            url = (base_url if base_url == '/' else base_url.lstrip('/'))
+            url_app_mapping[url] = app_name
+
+        self._apps = apps
+        self.app_names = tuple(sorted(apps))
+        self.url_mapping = dict(url_mapping)
+        self.url_app_mapping = url_app_mapping
+
+    def get(self, app_name):
+        """Get AppInfo for an application or None when is not enabled"""
+
+        return self._apps.get(app_name)
+
+    def __getitem__(self, app_name):
+        return self._apps[app_name]
+
+    def __contains__(self, app_name):
+        return (app_name in self._apps)
+
+    def __iter__(self):
+        for app_name in self.app_names:
+            yield self._apps[app_name]
+
+    def __len__(self):
+        return len(self._apps)
+
+
+def init_app_registry(url_mapping):
+    """Create global application registry for mapped applications"""
+
+    global REGISTRY
+
+    REGISTRY = AppRegistry(url_mapping)
+    for app_info in REGISTRY:
+        LOG.debug(u'Registered application %s %s at %s', app_info.name,
+                  app_info.version, app_info.base_url)
+
+    return REGISTRY
+
+
+def get_app_registry():
+    """Get global application registry"""
+
+    if REGISTRY is None:
+        msg = u'No app registry available. Call init_app_registry() first.'
+
+        raise AppRegistryException(msg)
+
+    return REGISTRY
+
+
+def get_app_info(app_name):
+    """Get AppInfo for an enabled application
+
+    None is returned when application is not enabled or
+    registry is not initialized yet.
+
+    """
+
+    if REGISTRY is None:
+        return
+
+    return REGISTRY.get(app_name)
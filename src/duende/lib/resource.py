@@ -31,14 +31,12 @@
 import os
 import logging
 import mimetypes
-import pkg_resources
 
-from pkg_resources import require
-from functools import partial
 from paste import fileapp
 from paste.util.import_string import try_import_module
 
 from duende import httpexc
+from duende.lib import registry
 
 LOG = logging.getLogger(__name__)
 
@@ -55,36 +53,36 @@ UTF_TYPES = (
     'text/csv',
 )
 
+#max size in bytes for egg resource files that are kept in memory
+PRELOAD_MAX_SIZE = 64 * 1024
+
 
 def get_resource_dir(app_name):
     """Get directory where application resource files are located."""
 
-    try:
-        info = require(app_name)
-    except pkg_resources.DistributionNotFound:
-        #application is not installed so no resource is available
-        return
-
-    info = info[0]
-    location = info.location
-    #for namespaced applications replace dot by directory separator
-    #to allow concatenation to access resources directory
-    if '.' in app_name:
-        app_name = app_name.replace('.', os.sep)
+    app_info = registry.get_app_info(app_name)
+    if app_info:
+        return app_info.resource_dir
 
-    dir = os.sep.join([location, app_name, 'resources'])
-    if os.path.isdir(dir):
-        return dir
+    return registry.find_resource_dir(app_name)
 
 
-def create_file_response(file_name):
-    """Create a response to return a file."""
+def get_content_type(file_name):
+    """Get content type to use when serving a file."""
 
     (content_type, encoding) = mimetypes.guess_type(file_name)
     #set utf8 for known types
     if content_type in UTF_TYPES:
         content_type = content_type + '; charset=utf8'
 
+    return content_type
+
+
+def create_file_response(file_name):
+    """Create a response to return a file."""
+
+    content_type = get_content_type(file_name)
+
     #TODO: Add caching information
     #headers = [
     #    ('Content-Type', content_type),
@@ -93,48 +91,133 @@ def create_file_response(file_name):
     return fileapp.FileApp(file_name, content_type=content_type)
 
 
-def resource_handler(uri, request):
-    """View to handle mapped resources."""
+class FileResourceHandler(object):
+    """View handler for a file resource
 
-    LOG.debug(u'Resolving resource %s', uri)
-    (protocol, resource) = uri.split(':')
+    When file contents are given they are served from memory,
+    otherwise a new file response is created for each request.
 
-    if protocol == 'url':
-        #redirect to given URL
-        raise httpexc.HTTPFound(location=uri)
+    """
+
+    #resource can be served without a request context
+    standalone = True
 
-    response = None
-    if protocol == 'call':
-        #get handler and call it with current request as parameter
+    def __init__(self, file_name, content_type, content=None):
+        self.file_name = file_name
+        self.content_type = content_type
+        self.data_app = None
+        if content is not None:
+            last_modified = os.path.getmtime(file_name)
+            self.data_app = fileapp.DataApp(None, content_type=content_type)
+            self.data_app.set_content(content, last_modified=last_modified)
+
+    def __call__(self, request=None):
+        if self.data_app:
+            return self.data_app
+
+        return fileapp.FileApp(self.file_name, content_type=self.content_type)
+
+
+class RedirectResourceHandler(object):
+    """View handler for resources that redirect to a URL"""
+
+    standalone = True
+
+    def __init__(self, location):
+        self.location = location
+
+    def __call__(self, request=None):
+        raise httpexc.HTTPFound(location=self.location)
+
+
+class MissingResourceHandler(object):
+    """View handler for resources with an invalid URI"""
+
+    standalone = True
+
+    def __call__(self, request=None):
+        raise httpexc.HTTPNotFound()
+
+
+class CallResourceHandler(object):
+    """View handler for resources that are generated by a view
+
+    View is imported the first time it is used.
+
+    """
+
+    standalone = False
+
+    def __init__(self, module_path, view_name):
+        self.module_path = module_path
+        self.view_name = view_name
+        self._view = None
+
+    @property
+    def view(self):
+        if not self._view:
+            module = try_import_module(self.module_path)
+            self._view = getattr(module, self.view_name, None)
+
+        return self._view
+
+    @property
+    def public(self):
+        #raise AttributeError when view has no access policy
+        return self.view.public
+
+    def __call__(self, request):
+        view = self.view
+        if not view:
+            LOG.error(u'Invalid resource view %s#%s', self.module_path,
+                      self.view_name)
+
+            raise httpexc.HTTPNotFound()
+
+        return view(request)
+
+
+def compile_resource_handler(uri, preload_max_size=PRELOAD_MAX_SIZE):
+    """Create a view handler for a resource uri
+
+    File paths, content types and for small files also file contents
+    are resolved when handler is created, so nothing has to be resolved
+    when a resource is requested. Handlers for invalid URIs always
+    return a not found response.
+
+    """
+
+    (protocol, resource) = uri.split(':', 1)
+    if protocol == 'url':
+        return RedirectResourceHandler(resource)
+    elif protocol == 'call':
         (module_path, view_name) = resource.split('#')
-        module = try_import_module(module_path)
-        view = getattr(module, view_name, None)
-        if view:
-            response = view(request)
+
+        return CallResourceHandler(module_path, view_name)
     elif protocol == 'egg':
-        #create a response with an iterator on resource file
         (app_name, file_path) = resource.split('#')
         resource_dir = get_resource_dir(app_name)
-        if resource_dir:
-            full_file_path = os.sep.join([resource_dir, file_path])
-            if os.path.isfile(full_file_path):
-                response = create_file_response(full_file_path)
-            else:
-                LOG.error(u'Invalid resource path: %s', full_file_path)
-    else:
-        LOG.error(u'Unknown resource URI: %s', uri)
-
-    if not response:
-        raise httpexc.HTTPNotFound()
+        if not resource_dir:
+            LOG.error(u'Application %s has no resources dir', app_name)
+
+            return MissingResourceHandler()
+
+        full_file_path = os.sep.join([resource_dir, file_path])
+        if not os.path.isfile(full_file_path):
+            LOG.error(u'Invalid resource path: %s', full_file_path)
+
+            return MissingResourceHandler()
 
-    return response
+        content = None
+        if os.path.getsize(full_file_path) <= preload_max_size:
+            with open(full_file_path, 'rb') as resource_file:
+                content = resource_file.read()
 
+        content_type = get_content_type(full_file_path)
 
-def get_view_handler(uri):
-    """Get a view handler for a resource uri."""
+        return FileResourceHandler(full_file_path, content_type,
+                                   content=content)
 
-    fn = partial(resource_handler, uri)
-    fn.__name__ = 'partial_resource_handler'
-    fn.__doc__ = 'Partial resource_handler function for uri %s' % uri
+    LOG.error(u'Unknown resource URI: %s', uri)
 
-    return fn
+    return MissingResourceHandler()
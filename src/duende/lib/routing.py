@@ -0,0 +1,244 @@
+# -*- coding: utf8 -*-
+#
+# Copyright (c) 2011, Jerónimo José Albi <jeronimo.albi@gmail.com>
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of copyright holders nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+# NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+# THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import re
+import uuid
+
+from paste.util.import_string import try_import_module
+
+from duende.lib.urls import URLMappingException
+
+#regex to match typed parameters in route patterns, like {id:int}
+RE_ROUTE_PARAM = re.compile(ur'^\{(?P<name>[a-zA-Z_]\w*):(?P<type>\w+)\}$')
+RE_SLUG = re.compile(ur'^[a-z0-9]+(?:-[a-z0-9]+)*$')
+
+
+def convert_int(value):
+    if not value.isdigit():
+        raise ValueError(value)
+
+    return int(value)
+
+
+def convert_slug(value):
+    if not RE_SLUG.match(value):
+        raise ValueError(value)
+
+    return value
+
+
+def convert_uuid(value):
+    return uuid.UUID(value)
+
+
+#converters for route parameters by type name.
+#converters must raise ValueError for invalid values.
+CONVERTERS = {
+    'int': convert_int,
+    'slug': convert_slug,
+    'uuid': convert_uuid,
+}
+
+
+class Route(object):
+    """A URL pattern mapped to a view"""
+
+    def __init__(self, name, pattern, view, app):
+        self.name = name
+        self.pattern = pattern
+        self.view = view
+        self.app = app
+
+    def __repr__(self):
+        return '<Route %s: %s>' % (self.name, self.pattern)
+
+
+class RouteNode(object):
+    """Node of the route trie for a single URL path segment"""
+
+    __slots__ = ('children', 'params', 'route')
+
+    def __init__(self):
+        #static segments by name
+        self.children = {}
+        #typed parameter segments as (name, converter, node) tuples
+        self.params = []
+        self.route = None
+
+
+class Router(object):
+    """Router that matches URLs against a trie of URL path segments
+
+    Matching cost depends on the number of segments in the URL, not on
+    the number of routes. Static segments have precedence over typed
+    parameters, and parameters are tried in the order routes were added.
+
+    """
+
+    def __init__(self):
+        self.root = RouteNode()
+        self.routes = []
+
+    def __len__(self):
+        return len(self.routes)
+
+    def add_route(self, route):
+        node = self.root
+        for segment in split_url(route.pattern):
+            param = RE_ROUTE_PARAM.match(segment)
+            if not param:
+                node = node.children.setdefault(segment.lower(), RouteNode())
+                continue
+
+            (name, type_name) = param.group('name', 'type')
+            #parameter names are used as view keyword arguments
+            name = str(name)
+            if type_name not in CONVERTERS:
+                msg = u'Unknown parameter type %s in route %s' \
+                    % (type_name, route.name)
+
+                raise URLMappingException(msg)
+
+            converter = CONVERTERS[type_name]
+            for (param_name, param_converter, param_node) in node.params:
+                if (param_name, param_converter) == (name, converter):
+                    node = param_node
+                    break
+            else:
+                param_node = RouteNode()
+                node.params.append((name, converter, param_node))
+                node = param_node
+
+        if node.route:
+            msg = u'Route %s has same pattern than route %s' \
+                % (route.name, node.route.name)
+
+            raise URLMappingException(msg)
+
+        node.route = route
+        self.routes.append(route)
+
+    def match(self, url):
+        """Match a normalized URL
+
+        Return a tuple with matched route and a dictionary with converted
+        parameter values, or None when URL does not match any route.
+
+        """
+
+        return self._match(self.root, split_url(url), 0, {})
+
+    def _match(self, node, segment_list, index, kwargs):
+        if index == len(segment_list):
+            if node.route:
+                return (node.route, kwargs)
+
+            return None
+
+        segment = segment_list[index]
+        child = node.children.get(segment)
+        if child:
+            match = self._match(child, segment_list, index + 1, kwargs)
+            if match:
+                return match
+
+        for (name, converter, param_node) in node.params:
+            try:
+                value = converter(segment)
+            except ValueError:
+                continue
+
+            param_kwargs = dict(kwargs)
+            param_kwargs[name] = value
+            match = self._match(param_node, segment_list, index + 1,
+                                param_kwargs)
+            if match:
+                return match
+
+        return None
+
+
+def split_url(url):
+    """Get a list with the path segments of a URL"""
+
+    url = url.strip(u'/')
+    if not url:
+        return []
+
+    return url.split(u'/')
+
+
+def get_app_for_module(module_path, app_list):
+    """Get name of the application that owns a view module"""
+
+    app_name = None
+    for name in app_list:
+        is_app_module = module_path.startswith(name + '.view.')
+        #use longest match to support applications inside other packages
+        if is_app_module and (not app_name or len(name) > len(app_name)):
+            app_name = name
+
+    return app_name
+
+
+def create_router(route_list, app_list):
+    """Create a Router for a list of (name, pattern, view uri) tuples
+
+    View uri has the format package.view.module#view_name, and module
+    must belong to the view package of an enabled application.
+
+    """
+
+    router = Router()
+    for (name, pattern, view_uri) in route_list:
+        try:
+            (module_path, view_name) = view_uri.split('#')
+        except ValueError:
+            msg = u'Invalid view %s for route %s' % (view_uri, name)
+
+            raise URLMappingException(msg)
+
+        app_name = get_app_for_module(module_path, app_list)
+        if not app_name:
+            msg = u'View %s for route %s is not part of an enabled app' \
+                % (view_uri, name)
+
+            raise URLMappingException(msg)
+
+        module = try_import_module(module_path)
+        view = getattr(module, view_name, None)
+        if not view:
+            msg = u'View %s for route %s not found' % (view_uri, name)
+
+            raise URLMappingException(msg)
+
+        router.add_route(Route(name, pattern, view, app_name))
+
+    return router
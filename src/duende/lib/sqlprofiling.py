@@ -0,0 +1,325 @@
+# -*- coding: utf8 -*-
+#
+# Copyright (c) 2011, Jerónimo José Albi <jeronimo.albi@gmail.com>
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of copyright holders nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+# NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+# THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import re
+import time
+import logging
+
+from threading import local
+
+from sqlalchemy import event
+from paste.deploy.converters import asbool
+from paste.deploy.converters import asint
+
+from duende import httpexc
+from duende.lib import db
+from duende.lib.cache import LRUCache
+from duende.lib.config import CONFIG
+from duende.lib.profiling import TimingRegistry
+from duende.lib.view import public
+from duende.lib.view import text
+
+LOG = logging.getLogger(__name__)
+
+#regular expressions used to get statement fingerprints
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+PARAM_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+PARAM_RE = re.compile(r'%\(\w+\)s|%s|:\w+|\$\d+|\?')
+SPACE_RE = re.compile(r'\s+')
+
+#statement prefix to get query plans for each dialect
+EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+
+#dialects where EXPLAIN uses the connection of the explained statement
+SHARED_CONNECTION_DIALECTS = ('sqlite',)
+
+#aggregated timings and row counts for each statement fingerprint
+SQL_TIMINGS = TimingRegistry()
+#fingerprints for recently executed statements
+FINGERPRINTS = LRUCache(1000)
+
+#profiling settings, set by init_sql_profiling
+ENABLED = False
+SLOW_QUERY_TIME = 0.5
+EXPLAIN_SLOW_QUERIES = True
+REPEATED_QUERY_LIMIT = 10
+
+#thread local storage for current request profile
+_REQUEST_PROFILE = local()
+
+
+def get_fingerprint(statement):
+    """Get a normalized statement without literal values
+
+    Statements that only differ in their parameters, literals or number
+    of values in IN clauses get the same fingerprint.
+
+    """
+
+    fingerprint = FINGERPRINTS.get(statement)
+    if fingerprint is None:
+        fingerprint = STRING_RE.sub('?', statement)
+        fingerprint = PARAM_RE.sub('?', fingerprint)
+        fingerprint = NUMBER_RE.sub('?', fingerprint)
+        fingerprint = PARAM_LIST_RE.sub('(?)', fingerprint)
+        fingerprint = SPACE_RE.sub(' ', fingerprint).strip()
+        FINGERPRINTS.set(statement, fingerprint)
+
+    return fingerprint
+
+
+class RequestProfile(object):
+    """Statements executed during a request grouped by fingerprint
+
+    Each fingerprint has a [count, total time, rows] list.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.statements = {}
+        self.repeated = set()
+
+    def add(self, fingerprint, duration, rows):
+        item = self.statements.get(fingerprint)
+        if item is None:
+            item = self.statements[fingerprint] = [0, 0.0, 0]
+
+        item[0] += 1
+        item[1] += duration
+        item[2] += rows
+
+        return item[0]
+
+
+def start_request_profile(path):
+    """Start recording executed statements for current request"""
+
+    if not ENABLED:
+        return
+
+    profile = RequestProfile(path)
+    _REQUEST_PROFILE.profile = profile
+
+    return profile
+
+
+def get_request_profile():
+    """Get statements profile for current request, or None"""
+
+    return getattr(_REQUEST_PROFILE, 'profile', None)
+
+
+def finish_request_profile():
+    """Finish recording statements for current request
+
+    Statements profile for the request is returned.
+
+    """
+
+    profile = get_request_profile()
+    if profile is None:
+        return
+
+    del _REQUEST_PROFILE.profile
+    if profile.repeated:
+        LOG.warning(u'Repeated statements in %s: %s', profile.path,
+                    u'; '.join(u'%d x %s' % (profile.statements[name][0],
+                                            name)
+                               for name in profile.repeated))
+
+    return profile
+
+
+def _explain(conn, cursor, statement, parameters):
+    """Get query plan for a statement as a list of unicode lines
+
+    Plan is fetched using a different pooled connection, because a failed
+    EXPLAIN aborts the current transaction in some databases, like
+    PostgreSQL. SQLite connections are usually shared by all the thread,
+    and failed statements don't abort transactions, so current connection
+    is used.
+
+    """
+
+    prefix = EXPLAIN_PREFIXES.get(conn.dialect.name, 'EXPLAIN ')
+    #raw DBAPI connections are used so statement is not profiled again
+    if conn.dialect.name in SHARED_CONNECTION_DIALECTS:
+        explain_conn = None
+        explain_cursor = conn.connection.cursor()
+    else:
+        explain_conn = conn.engine.raw_connection()
+        explain_cursor = explain_conn.cursor()
+
+    try:
+        explain_cursor.execute(prefix + statement, parameters)
+        return [u' '.join(unicode(value) for value in row)
+                for row in explain_cursor.fetchall()]
+    finally:
+        explain_cursor.close()
+        if explain_conn is not None:
+            #connection is rolled back when it is returned to the pool
+            explain_conn.close()
+
+
+def _log_slow_query(conn, cursor, statement, parameters, duration,
+                    executemany):
+    lines = [u'Slow query (%.2fms): %s' % (duration * 1000, statement)]
+    is_select = statement.lstrip()[:6].lower() == 'select'
+    if EXPLAIN_SLOW_QUERIES and is_select and not executemany:
+        try:
+            lines.extend(_explain(conn, cursor, statement, parameters))
+        except Exception, err:
+            LOG.debug(u'Unable to get query plan: %s', err)
+
+    LOG.warning(u'\n    '.join(lines))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault('duende.sql_start', []).append(time.time())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    start_list = conn.info.get('duende.sql_start')
+    if not start_list:
+        return
+
+    duration = time.time() - start_list.pop()
+    fingerprint = get_fingerprint(statement)
+    #row count is not available for all statements and drivers
+    rows = max(cursor.rowcount, 0)
+    SQL_TIMINGS.add(fingerprint, duration, size=rows)
+
+    profile = get_request_profile()
+    if profile is not None:
+        count = profile.add(fingerprint, duration, rows)
+        if REPEATED_QUERY_LIMIT and count > REPEATED_QUERY_LIMIT:
+            profile.repeated.add(fingerprint)
+
+    if duration >= SLOW_QUERY_TIME:
+        _log_slow_query(conn, cursor, statement, parameters, duration,
+                        executemany)
+
+
+def init_sql_profiling(config):
+    """Attach statement profiling to database engines
+
+    Profiling is enabled using database.profile setting. Database engines
+    must be initialized before calling this function.
+
+    """
+
+    global ENABLED
+    global SLOW_QUERY_TIME
+    global EXPLAIN_SLOW_QUERIES
+    global REPEATED_QUERY_LIMIT
+
+    ENABLED = asbool(config.get('database.profile'))
+    if not ENABLED:
+        return
+
+    SLOW_QUERY_TIME = asint(config.get('database.slow_query_ms', 500)) / 1000.0
+    EXPLAIN_SLOW_QUERIES = asbool(config.get('database.explain_slow_queries',
+                                             True))
+    REPEATED_QUERY_LIMIT = asint(config.get('database.repeated_query_limit',
+                                            10))
+
+    engines = [db.ENGINE] + [engine for (name, engine) in db.REPLICAS]
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    LOG.info(u'SQL statement profiling is enabled')
+
+
+def get_sql_timings(count=None, key='total'):
+    """Get a list of statement fingerprint timings sorted by given key
+
+    Each item is a dictionary with count, total, average, min, max,
+    size and histogram values. Size is the number of rows and times
+    are in seconds.
+
+    """
+
+    return SQL_TIMINGS.get_top(count=count, key=key)
+
+
+def format_sql_timings(stats_list, title=None):
+    """Get a unicode table for a list of statement timings"""
+
+    lines = []
+    if title:
+        lines.append(title)
+        lines.append(u'=' * len(title))
+
+    lines.append(u'%10s %10s %10s %10s %10s  %s'
+                 % (u'calls', u'total ms', u'avg ms', u'max ms', u'rows',
+                    u'statement'))
+    for stats in stats_list:
+        lines.append(u'%10d %10.2f %10.2f %10.2f %10d  %s'
+                     % (stats['count'], stats['total'] * 1000,
+                        stats['average'] * 1000, stats['max'] * 1000,
+                        stats['size'], stats['name']))
+
+    return u'\n'.join(lines) + u'\n'
+
+
+@public
+@text()
+def sql_profile(request):
+    """View that displays statement fingerprints sorted by total time
+
+    View is only available in debug mode when database.profile is
+    enabled. Add it to application urls.ini [resources] section to use it:
+
+        _profile/sql = call:duende.lib.sqlprofiling#sql_profile
+
+    Sort key and number of statements can be given using 'sort' and
+    'count' query string arguments.
+
+    """
+
+    if not ENABLED or not asbool(CONFIG.get('debug')):
+        raise httpexc.HTTPNotFound()
+
+    key = request.GET.get('sort', 'total')
+    if key not in ('total', 'average', 'count', 'max', 'size'):
+        raise httpexc.HTTPBadRequest()
+
+    count = request.GET.get('count')
+    count = (int(count) if count and count.isdigit() else None)
+    stats_list = get_sql_timings(count=count, key=key)
+
+    return format_sql_timings(stats_list, title=u'SQL statement timings')
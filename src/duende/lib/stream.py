@@ -0,0 +1,92 @@
+# -*- coding: utf8 -*-
+#
+# Copyright (c) 2011, Jerónimo José Albi <jeronimo.albi@gmail.com>
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of copyright holders nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+# NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+# THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+from duende import REQUEST
+
+#min size in bytes of each chunk sent to client when streaming
+CHUNK_SIZE = 8192
+
+
+def encode_chunks(chunk_iter, encoding='utf8', chunk_size=CHUNK_SIZE):
+    """Encode unicode chunks and join them in bigger chunks
+
+    Generator yields encoded strings of at least chunk_size bytes,
+    with exception of the last one.
+
+    """
+
+    buffer = []
+    size = 0
+    for chunk in chunk_iter:
+        if isinstance(chunk, unicode):
+            chunk = chunk.encode(encoding)
+
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+
+    if buffer:
+        yield ''.join(buffer)
+
+
+class RequestContextIterator(object):
+    """Iterator that makes current request available while iterating
+
+    Request globals are removed once views return a response, so contents
+    that are generated while response is sent, like streamed templates,
+    need the request to be registered again to use translations and other
+    request related functions.
+
+    """
+
+    def __init__(self, iterable, request=None):
+        if request is None:
+            request = REQUEST._current_obj()
+
+        self.request = request
+        self.iterable = iterable
+        self._iter = iter(iterable)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        REQUEST._push_object(self.request)
+        try:
+            return self._iter.next()
+        finally:
+            REQUEST._pop_object(self.request)
+
+    def close(self):
+        if hasattr(self.iterable, 'close'):
+            self.iterable.close()
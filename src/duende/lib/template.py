@@ -28,30 +28,64 @@
 # THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
+import time
+import hashlib
 import logging
 import mimetypes
 
 from functools import wraps
+from threading import Lock
 
 from jinja2 import Environment
+from jinja2 import FileSystemLoader
+from jinja2 import Template
+from jinja2 import ModuleLoader
 from jinja2 import PrefixLoader
 from jinja2 import PackageLoader
 from jinja2 import TemplateAssertionError
 from jinja2 import FileSystemBytecodeCache
 from jinja2 import nodes
+from jinja2.runtime import Context
+from jinja2.runtime import Macro
 from jinja2.utils import Markup
 from jinja2.utils import contextfunction
+from jinja2.ext import Extension
 from jinja2.ext import InternationalizationExtension
+from jinja2.visitor import NodeTransformer
 from paste.deploy.converters import asbool
+from paste.deploy.converters import asint
 
 from duende import REQUEST
+from duende import httpexc
 from duende import Response
-from duende import get_enabled_app_list
+from duende.lib import cache
 from duende.lib import urls
+from duende.lib.bytecodecache import PackBytecodeCache
+from duende.lib.registry import get_app_registry
+from duende.lib.profiling import TimingRegistry
+from duende.lib.profiling import TimingStack
+from duende.lib.profiling import format_timings
+from duende.lib.stream import encode_chunks
+from duende.lib.stream import RequestContextIterator
+from duende.lib.i18n import dates
+from duende.lib.i18n import jscatalog
+from duende.lib.i18n import numbers
+from duende.lib.i18n import translation
+from duende.lib.view import public
+from duende.lib.view import text
 
 LOG = logging.getLogger(__name__)
 
 ENVIRON = None
+#cache namespace for rendered template fragments
+FRAGMENT_CACHE_NAMESPACE = 'duende.template.fragments'
+FRAGMENT_CACHE_STATS = {'hits': 0, 'misses': 0}
+_FRAGMENT_CACHE_STATS_LOCK = Lock()
+#render timings for templates and macros when template.profile is enabled
+TEMPLATE_TIMINGS = TimingRegistry()
+_TIMING_STACK = TimingStack()
+#environments with inlined translations for each list of languages
+LOCALE_ENVIRONS = None
 
 
 class TemplateException(Exception):
@@ -106,6 +140,117 @@ def _make_new_ngettext(func):
     return ngettext
 
 
+def _make_inline_translation_node(environment, domain, message, variables):
+    """Create a node with a message translated at compile time
+
+    None is returned when environment has no translations to inline,
+    or when message can't be translated, so translation is resolved
+    when template is rendered.
+
+    """
+
+    translation_mgr = environment.inline_translations
+    if not translation_mgr:
+        return
+
+    try:
+        translated = translation_mgr.gettext(domain, message)
+    except Exception, err:
+        LOG.debug(u'Message not inlined for domain %s: %s', domain, err)
+        return
+
+    #interpolation is the same that is done by newstyle gettext
+    if not variables and '%' not in translated:
+        return nodes.MarkSafeIfAutoescape(nodes.Const(translated))
+
+    pairs = [nodes.Pair(nodes.Const(key), value)
+             for (key, value) in variables.iteritems()]
+
+    return nodes.Mod(nodes.MarkSafeIfAutoescape(nodes.Const(translated)),
+                     nodes.Dict(pairs))
+
+
+def _is_alias_shadowed(node):
+    """Check if a template assigns a value to the _ translation alias
+
+    Assignments, loops, macro arguments and imports can define _ as a
+    template variable, so calls to _ can't be translated at compile time.
+
+    """
+
+    for name_node in node.find_all(nodes.Name):
+        if name_node.name == '_' and name_node.ctx in ('store', 'param'):
+            return True
+
+    for import_node in node.find_all((nodes.Import, nodes.FromImport)):
+        if isinstance(import_node, nodes.Import):
+            names = [import_node.target]
+        else:
+            names = [(item[1] if isinstance(item, tuple) else item)
+                     for item in import_node.names]
+
+        if '_' in names:
+            return True
+
+    return False
+
+
+class InlineTranslationTransformer(NodeTransformer):
+    """Replace calls to _ function with constant arguments by translations"""
+
+    def __init__(self, environment, template_name):
+        self.environment = environment
+        self.template_name = template_name
+
+    def visit_Call(self, node):
+        node = self.generic_visit(node)
+        is_alias_call = (isinstance(node.node, nodes.Name)
+                         and node.node.name == '_')
+        if not is_alias_call or node.dyn_args or node.dyn_kwargs:
+            return node
+
+        if not all(isinstance(arg, nodes.Const) for arg in node.args):
+            return node
+
+        if len(node.args) == 1:
+            domain = self.template_name.split('/')[0]
+            message = node.args[0].value
+        elif len(node.args) == 2:
+            (message, domain) = [arg.value for arg in node.args]
+        else:
+            return node
+
+        variables = dict((kwarg.key, kwarg.value) for kwarg in node.kwargs)
+        inline_node = _make_inline_translation_node(self.environment, domain,
+                                                    message, variables)
+        if inline_node is None:
+            return node
+
+        inline_node.set_lineno(node.lineno)
+        inline_node.set_environment(self.environment)
+
+        return inline_node
+
+
+class DuendeEnvironment(Environment):
+    """Template environment that supports inlined translations
+
+    When inline_translations is a TranslationManager, constant translatable
+    strings are translated when templates are compiled.
+
+    """
+
+    inline_translations = None
+
+    def _parse(self, source, name, filename):
+        node = super(DuendeEnvironment, self)._parse(source, name, filename)
+        if self.inline_translations and name and not _is_alias_shadowed(node):
+            transformer = InlineTranslationTransformer(self, name)
+            node = transformer.visit(node)
+
+        return node
+
+
 class I18NDomainExtension(InternationalizationExtension):
     """Jinja2 extension to allow using domains in template translation"""
 
@@ -231,6 +376,11 @@ class I18NDomainExtension(InternationalizationExtension):
 
         # singular only:
         if plural_expr is None:
+            node = _make_inline_translation_node(self.environment, domain,
+                                                 singular, variables)
+            if node is not None:
+                return nodes.Output([node])
+
             gettext = nodes.Name('gettext', 'load')
             node = nodes.Call(gettext, [
                 nodes.Const(domain),
@@ -274,7 +424,187 @@ class I18NDomainExtension(InternationalizationExtension):
 i18n = I18NDomainExtension
 
 
-def template(template_name):
+def _record_fragment_cache_stats(hit):
+    with _FRAGMENT_CACHE_STATS_LOCK:
+        FRAGMENT_CACHE_STATS['hits' if hit else 'misses'] += 1
+
+
+class FragmentCacheExtension(Extension):
+    """Jinja2 extension to cache rendered template fragments
+
+    Fragments are stored in global cache manager, so backend is selected
+    using cache.* config values. Cache keys include template name and
+    current request locale, so same key can be used in different templates.
+    Time to live in seconds is optional.
+
+    Usage:
+
+        {% cache 'sidebar', 300 %}
+            ...
+        {% endcache %}
+
+    """
+
+    tags = set(['cache'])
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.Const(parser.name), parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        call = self.call_method('_cache_template_fragment', args)
+        node = nodes.CallBlock(call, [], [], body)
+        node.set_lineno(lineno)
+
+        return node
+
+    def _cache_template_fragment(self, template_name, key, ttl, caller):
+        locale = REQUEST.environ.get('duende.locale')
+        cache_key = u'%s:%s:%s' % (template_name, locale, key)
+        fragment_cache = cache.get_cache(FRAGMENT_CACHE_NAMESPACE)
+        try:
+            fragment = fragment_cache.get(cache_key, expiretime=ttl)
+            _record_fragment_cache_stats(hit=True)
+        except KeyError:
+            _record_fragment_cache_stats(hit=False)
+            fragment = caller()
+            fragment_cache.put(cache_key, fragment, expiretime=ttl)
+
+        return fragment
+
+
+fragment_cache = FragmentCacheExtension
+
+
+def get_fragment_cache_stats():
+    """Get a dictionary with hits, misses and hit ratio of fragment cache"""
+
+    with _FRAGMENT_CACHE_STATS_LOCK:
+        stats = dict(FRAGMENT_CACHE_STATS)
+
+    total = stats['hits'] + stats['misses']
+    stats['ratio'] = (float(stats['hits']) / total if total else 0.0)
+
+    return stats
+
+
+def _profile_render_func(name, render_func):
+    """Wrap a template render function to record its timing
+
+    Time is only counted while template events are generated, so time
+    spent by client consuming streamed templates is not included.
+
+    """
+
+    def root_render_func(context):
+        event_iter = render_func(context)
+        duration = 0.0
+        size = 0
+        timer = _TIMING_STACK.push()
+        try:
+            while True:
+                start_time = time.time()
+                try:
+                    event = next(event_iter)
+                except StopIteration:
+                    break
+                finally:
+                    duration += time.time() - start_time
+
+                size += len(event)
+                yield event
+        finally:
+            _TIMING_STACK.pop(duration)
+            (child, macro) = timer
+            TEMPLATE_TIMINGS.add(name, duration, size=size, child=child,
+                                 macro=macro)
+
+    return root_render_func
+
+
+class ProfilingTemplate(Template):
+    """Template class that records render timings for each template
+
+    Included and extended templates are recorded separately and their
+    time is also counted as child time of the template that uses them.
+
+    """
+
+    @classmethod
+    def _from_namespace(cls, environment, namespace, globals):
+        tpl = super(ProfilingTemplate, cls)._from_namespace(environment,
+                                                            namespace,
+                                                            globals)
+        tpl.root_render_func = _profile_render_func(tpl.name,
+                                                    tpl.root_render_func)
+
+        return tpl
+
+
+class ProfilingContext(Context):
+    """Template context that records timings for macro calls"""
+
+    def call(__self, __obj, *args, **kwargs):
+        if not isinstance(__obj, Macro):
+            return Context.call(__self, __obj, *args, **kwargs)
+
+        name = u'%s (macro %s)' % (__self.name, __obj.name)
+        timer = _TIMING_STACK.push()
+        start_time = time.time()
+        try:
+            return Context.call(__self, __obj, *args, **kwargs)
+        finally:
+            duration = time.time() - start_time
+            _TIMING_STACK.pop(duration, is_macro=True)
+            (child, macro) = timer
+            TEMPLATE_TIMINGS.add(name, duration, child=child, macro=macro)
+
+
+def get_template_timings(count=None, key='total'):
+    """Get a list of template timings sorted by given key
+
+    Each item is a dictionary with count, total, own, child, macro,
+    average, min, max, size and histogram values. Times are in seconds.
+
+    """
+
+    return TEMPLATE_TIMINGS.get_top(count=count, key=key)
+
+
+@public
+@text()
+def template_profile(request):
+    """View that displays templates sorted by total render time
+
+    View is only available in debug mode. Add it to application
+    urls.ini [resources] section to use it:
+
+        _profile/templates = call:duende.lib.template#template_profile
+
+    Sort key and number of templates can be given using 'sort' and
+    'count' query string arguments.
+
+    """
+
+    if not ENVIRON.globals.get('DEBUG'):
+        raise httpexc.HTTPNotFound()
+
+    key = request.GET.get('sort', 'total')
+    if key not in ('total', 'own', 'child', 'macro', 'count', 'max', 'size'):
+        raise httpexc.HTTPBadRequest()
+
+    count = request.GET.get('count')
+    count = (int(count) if count and count.isdigit() else None)
+    stats_list = get_template_timings(count=count, key=key)
+
+    return format_timings(stats_list, title=u'Template render timings')
+
+
+def template(template_name, stream=False):
     """Decorator to return a request based on a template output
 
     View handlres has to return a dictionary that will be used to initialize
@@ -282,6 +612,8 @@ def template(template_name):
     If None is returned then no variables will be assigned to template.
     To override given template a context variable named _template can be
     given with the new template name to use.
+    When stream is True template is rendered while response is sent to
+    client, in encoded chunks.
 
     Usage:
 
@@ -307,9 +639,9 @@ def template(template_name):
             #if a template name is given use it instead current template name
             if context is not None and '_template' in context:
                 _template = context['_template']
-                tpl_text = render(REQUEST, _template, context=context)
             else:
-                tpl_text = render(REQUEST, template_name, context=context)
+                _template = template_name
+
             #get mime type from template name
             (mime_type, encoding) = mimetypes.guess_type(template_name)
             if not encoding:
@@ -324,7 +656,13 @@ def template(template_name):
             response = Response()
             response.headers['Content-Type'] = mime_type
             response.charset = encoding
-            response.unicode_body = tpl_text
+            if stream:
+                chunks = generate(REQUEST, _template, context=context)
+                chunks = encode_chunks(chunks, encoding=encoding)
+                response.app_iter = RequestContextIterator(chunks)
+            else:
+                tpl_text = render(REQUEST, _template, context=context)
+                response.unicode_body = tpl_text
 
             return response
 
@@ -333,9 +671,7 @@ def template(template_name):
     return _template
 
 
-def render(request, template_name, context=None):
-    """Get template contents."""
-
+def _get_template_context(request, context):
     if not context:
         context = {}
 
@@ -352,12 +688,107 @@ def render(request, template_name, context=None):
     else:
         LOG.info(u'Flash is not enabled')
 
+    return context
+
+
+def render(request, template_name, context=None):
+    """Get template contents."""
+
+    context = _get_template_context(request, context)
     LOG.debug(u'Rendering template name %s', template_name)
-    template = ENVIRON.get_template(template_name)
+    template = get_environment(request).get_template(template_name)
 
     return template.render(**context)
 
 
+def generate(request, template_name, context=None):
+    """Get a generator that renders template contents in chunks."""
+
+    context = _get_template_context(request, context)
+    LOG.debug(u'Generating template name %s', template_name)
+    template = get_environment(request).get_template(template_name)
+
+    return template.generate(**context)
+
+
+def create_bytecode_cache(cache_dir, type='file', variant=None):
+    """Create a bytecode cache for templates
+
+    Type can be 'file', to save each template in a different file, or
+    'pack' to save all templates in a single file that is memory mapped
+    and shared between processes. When a variant is given it is used as
+    part of cache file names.
+
+    """
+
+    if type == 'pack':
+        if variant:
+            name = 'templates.%s.pack' % variant
+        else:
+            name = 'templates.pack'
+
+        return PackBytecodeCache(cache_dir, name=name)
+    elif type == 'file':
+        if variant:
+            pattern = '%%s.%s.cache' % variant
+        else:
+            pattern = '%s.cache'
+
+        return FileSystemBytecodeCache(cache_dir, pattern)
+    else:
+        msg = u'Invalid template bytecode cache type %s' % type
+
+        raise TemplateException(msg)
+
+
+def _create_locale_environment(languages):
+    LOG.info(u'Creating template environment for languages %s',
+             u', '.join(languages))
+    overlay_params = {}
+    #set cache size to avoid copying cached templates to overlay
+    overlay_params['cache_size'] = getattr(ENVIRON.cache, 'capacity', 0)
+    translation_mgr = translation.get_translation_manager(languages)
+    if ENVIRON.bytecode_cache:
+        #bytecode cache file names include a hash of languages and catalog
+        #files, so bytecode is not reused after catalogs are changed
+        fingerprint = translation_mgr.get_catalog_fingerprint()
+        key = hashlib.sha1('|'.join(languages) + fingerprint).hexdigest()[:16]
+        bytecode_cache = ENVIRON.bytecode_cache
+        if isinstance(bytecode_cache, PackBytecodeCache):
+            cache_type = 'pack'
+        else:
+            cache_type = 'file'
+
+        overlay_params['bytecode_cache'] = create_bytecode_cache(
+            bytecode_cache.directory, type=cache_type, variant=key)
+
+    environ = ENVIRON.overlay(**overlay_params)
+    environ.inline_translations = translation_mgr
+
+    return environ
+
+
+def get_environment(request):
+    """Get template environment for a request
+
+    When inlined translations are enabled an environment for current
+    request languages is returned, otherwise global environment is used.
+
+    """
+
+    if LOCALE_ENVIRONS is None:
+        return ENVIRON
+
+    translation_mgr = request.environ['duende.translation']
+    languages = tuple(translation_mgr.languages)
+    environ = LOCALE_ENVIRONS.get(languages)
+    if environ is None:
+        environ = _create_locale_environment(list(languages))
+        LOCALE_ENVIRONS.set(languages, environ)
+
+    return environ
+
+
 def get_enabled_app_extensions(config):
     """Get a list of Jinja2 extension to load
 
@@ -377,21 +808,35 @@ def get_enabled_app_extensions(config):
     return extension_list
 
 
-def init_template_environment(config):
-    """Initialize template support"""
+def get_source_loader():
+    """Get a loader for template sources of all enabled applications"""
 
-    global ENVIRON
-
-    enabled_app_list = get_enabled_app_list()
     #add a template loader for each application
     mapping_dict = {}
-    for app_name in enabled_app_list:
-        path = 'resources/templates'
-        mapping_dict[app_name] = PackageLoader(app_name, package_path=path)
+    for app_info in get_app_registry():
+        if app_info.template_dir:
+            loader = FileSystemLoader(app_info.template_dir)
+        else:
+            #application templates might be inside a zipped egg
+            path = 'resources/templates'
+            loader = PackageLoader(app_info.name, package_path=path)
+
+        mapping_dict[app_info.name] = loader
+
+    return PrefixLoader(mapping_dict)
+
+
+def init_template_environment(config, use_compiled=True):
+    """Initialize template support
+
+    When template.compiled is true templates are loaded from modules
+    created by duende_compile_templates command, and template sources
+    are never checked for changes.
+
+    """
 
-    loader = PrefixLoader(mapping_dict)
-    bytecode_cache = FileSystemBytecodeCache(config['template.cache_dir'],
-                                             '%s.cache')
+    global ENVIRON
+    global LOCALE_ENVIRONS
 
     #create a list with I18N extension and installed application extensions
     app_extension_list = get_enabled_app_extensions(config)
@@ -401,14 +846,69 @@ def init_template_environment(config):
     environ_params = {}
     environ_params['extensions'] = extension_list
     environ_params['trim_blocks'] = True
-    environ_params['loader'] = loader
-    environ_params['bytecode_cache'] = bytecode_cache
-    ENVIRON = Environment(**environ_params)
+    environ_params['cache_size'] = asint(config.get('template.cache_size',
+                                                    1000))
+    use_compiled = use_compiled and asbool(config.get('template.compiled'))
+    if use_compiled:
+        compiled_path = config['template.compiled_path']
+        LOG.info(u'Using compiled templates from %s', compiled_path)
+        environ_params['loader'] = ModuleLoader(compiled_path)
+        environ_params['auto_reload'] = False
+    else:
+        cache_dir = config['template.cache_dir']
+        cache_type = config.get('template.bytecode_cache', 'file')
+        bytecode_cache = create_bytecode_cache(cache_dir, type=cache_type)
+        environ_params['loader'] = get_source_loader()
+        environ_params['bytecode_cache'] = bytecode_cache
+
+    ENVIRON = DuendeEnvironment(**environ_params)
+    if asbool(config.get('template.profile')):
+        LOG.info(u'Template render profiling is enabled')
+        ENVIRON.template_class = ProfilingTemplate
+        ENVIRON.context_class = ProfilingContext
+
+    #translation functions get the translation manager of current request
+    #each time they are called, so they are installed only once
+    ENVIRON.install_gettext_callables(translation.dgettext,
+                                      translation.dngettext,
+                                      newstyle=True)
+
+    inline_translations = asbool(config.get('template.inline_translations'))
+    if inline_translations and not use_compiled:
+        size = asint(config.get('template.inline_translations_size', 20))
+        LOCALE_ENVIRONS = cache.LRUCache(size)
+    else:
+        if inline_translations:
+            LOG.warning(u'Inlined translations are not supported for '
+                        u'compiled templates')
+
+        LOCALE_ENVIRONS = None
 
     #TODO: Allow apps to add context values here ?
     context = {}
     context['url'] = urls.url
+    context['catalog_url'] = jscatalog.catalog_url
     context['DEBUG'] = asbool(config['debug'])
 
     #update template environment
     ENVIRON.globals.update(context)
+    #add locale formatting filters
+    ENVIRON.filters.update({
+        'date': dates.format_date,
+        'time': dates.format_time,
+        'datetime': dates.format_datetime,
+        'number': numbers.format_number,
+    })
+
+
+def compile_templates(config, target, zip=None):
+    """Compile templates of all enabled applications to python modules
+
+    Modules are saved in target directory, or in a zip file when zip
+    compression method is given ('deflated' or 'stored').
+
+    """
+
+    init_template_environment(config, use_compiled=False)
+    ENVIRON.compile_templates(target, zip=zip, log_function=LOG.info,
+                              ignore_errors=False, py_compile=True)
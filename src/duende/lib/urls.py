@@ -34,6 +34,7 @@ import re
 import urllib
 import urlparse
 
+from duende.lib import resource
 from duende.lib.config import CONFIG
 from duende.lib.text import SLUG_HYPENATE_RE
 from duende.lib.text import utf8_to_unicode
@@ -65,7 +66,8 @@ def init_application_urls(url_file_name):
 
     _MAPPINGS['url'] = {}
     _MAPPINGS['resource'] = {}
-
+    _MAPPINGS['resource_handler'] = {}
+    _MAPPINGS['route'] = []
 
     LOG.debug(u'Initializing application url mappings')
     config = ConfigParser.ConfigParser()
@@ -89,7 +91,23 @@ def init_application_urls(url_file_name):
 
     if 'resources' in sections:
         for (resource_name, uri) in config.items('resources'):
-            _MAPPINGS['resource'][unicode(resource_name, 'utf8')] = uri
+            resource_name = unicode(resource_name, 'utf8')
+            _MAPPINGS['resource'][resource_name] = uri
+            #create handlers once so resources are served without lookups
+            handler = resource.compile_resource_handler(uri)
+            _MAPPINGS['resource_handler'][resource_name] = handler
+
+    if 'routes' in sections:
+        for (route_name, value) in config.items('routes'):
+            try:
+                (pattern, view_uri) = value.split()
+            except ValueError:
+                msg = u'Invalid value for route %s' % route_name
+
+                raise URLMappingException(msg)
+
+            route = (route_name, unicode(pattern, 'utf8'), view_uri)
+            _MAPPINGS['route'].append(route)
 
 
 def url_apply(url, *args, **kwargs):
@@ -223,6 +241,21 @@ def get_resource_mapping():
     return mapping
 
 
+def get_resource_handlers():
+    """Get a dictionary with view handlers for mapped resources."""
+
+    mapping = {}
+    mapping.update(_MAPPINGS['resource_handler'])
+
+    return mapping
+
+
+def get_route_mapping():
+    """Get a list of (name, URL pattern, view) tuples with mapped routes."""
+
+    return list(_MAPPINGS['route'])
+
+
 def url_slugify(url, quote=False):
     """Slugify path for given URL
 
@@ -36,6 +36,8 @@ from duende import Response
 from duende import httpexc
 from duende.lib import jsonrpc
 from duende.lib.jsonrpc import JSONResponse
+from duende.lib.stream import encode_chunks
+from duende.lib.stream import RequestContextIterator
 
 
 def restrict(method):
@@ -149,6 +151,42 @@ def text(encoding='utf8'):
     return _text
 
 
+def stream(content_type='text/plain', encoding='utf8'):
+    """Decorator to send contents to client while they are generated
+
+    View handler must return an iterable of unicode or encoded strings,
+    usually a generator that uses db.stream or Query.stream to keep
+    memory usage flat for big results. Chunks are joined in bigger chunks
+    before they are sent.
+
+    Example:
+
+        @stream('text/csv')
+        def export(request):
+            for row in db.stream('SELECT name, code FROM country'):
+                yield u'%s,%s\n' % (row.name, row.code)
+
+    """
+
+    def _stream(func):
+
+        @wraps(func)
+        def _stream_wrap(*args, **kwargs):
+            chunks = func(*args, **kwargs)
+            response = Response()
+            response.headers['Content-Type'] = '%s; charset=%s' \
+                                             % (content_type, encoding)
+            response.charset = encoding
+            chunks = encode_chunks(chunks, encoding=encoding)
+            response.app_iter = RequestContextIterator(chunks)
+
+            return response
+
+        return _stream_wrap
+
+    return _stream
+
+
 def utf8_text(func):
     """Decorator for request of type text/plain in UTF-8
 
@@ -30,17 +30,22 @@
 
 import logging
 
-import babel
 import formencode
 
+from paste.deploy.converters import asbool
+from paste.deploy.converters import asint
+from paste.wsgilib import add_close
+
+from duende import CACHE
 from duende import REQUEST
 from duende import Request
+from duende.lib import cache
 from duende.lib import db
+from duende.lib import sqlprofiling
 from duende.lib import template
-from duende.lib import urls
 from duende.middleware import MiddlewareException
 from duende.lib.i18n import translation
-from duende.lib.i18n import get_http_locales
+from duende.lib.i18n import LocaleNegotiator
 
 LOG = logging.getLogger(__name__)
 
@@ -60,12 +65,26 @@ class DuendeApplication(object):
         self.config = config
         self.default_locale = self.config['default_locale']
 
-        urls.init_application_urls(self.config['url.file'])
+        cache.init_cache_manager(self.config)
+        translation.init_translations(self.config)
         template.init_template_environment(self.config)
         db.init_database_engine(self.config)
         db.init_database_session()
+        sqlprofiling.init_sql_profiling(self.config)
+
+        available_locales = translation.get_available_locales()
+        LOG.debug(u'Available locales: %s', u', '.join(available_locales))
+        cache_size = asint(self.config.get('i18n.negotiation_cache_size',
+                                           1000))
+        self.locale_negotiator = LocaleNegotiator(self.default_locale,
+                                                  available=available_locales,
+                                                  cache_size=cache_size)
+        #language used for FormEncode messages
+        self.form_language = None
+        self.db_stats_header = asbool(self.config.get('database.stats_header'))
 
     def _init_globals(self, environ):
+        global CACHE
         global REQUEST
 
         if 'beaker.session' not in environ:
@@ -82,54 +101,30 @@ class DuendeApplication(object):
         request.session = environ['beaker.session']
         #register globals
         paste_registry.register(REQUEST, request)
+        paste_registry.register(CACHE, cache.CACHE_MANAGER)
 
-    def _init_translations(self, environ):
-        #TODO: Allow setting locale using request parameters
-        #get locale list from current request
-        accept_language = environ['HTTP_ACCEPT_LANGUAGE']
-        locale_list = get_http_locales(accept_language,
-                                       default=self.default_locale)
-
-        #create an save translation manager for current request languages
-        self.translation = translation.TranslationManager(locale_list)
-        environ['duende.translation'] = self.translation
-
-        #install template engine translation functions
-        gettext = translation.dgettext
-        ngettext = translation.dngettext
-        TPL_ENV = template.ENVIRON
-        TPL_ENV.install_gettext_callables(gettext, ngettext, newstyle=True)
-
-    def _init_locale(self, environ):
-        locale = None
-        translation = self.translation
-        for code in translation.locale_list:
-            try:
-                locale = babel.Locale.parse(code)
-                environ['duende.locale'] = locale
-                LOG.debug(u'Using locale %s', code)
-                #after sucessfully setting a locale skip other locales
-                break
-            except babel.UnknownLocaleError:
-                #skip unknown locales
-                pass
+    def _init_translations(self, environ, locale_list):
+        #get an save translation manager for current request languages.
+        #template engine gets translation manager from current request.
+        manager = translation.get_translation_manager(locale_list)
+        environ['duende.translation'] = manager
+
+        return manager
+
+    def _init_locale(self, environ, locale):
+        if locale:
+            environ['duende.locale'] = locale
+            LOG.debug(u'Using locale %s', locale)
 
         #TODO: Use all request languages instead of only current one
         language = getattr(locale, 'language', self.default_locale)
-        formencode.api.set_stdtranslation(languages=[language])
+        #FormEncode translation is global so it is only changed when
+        #language is different than the one used in previous request
+        if language != self.form_language:
+            formencode.api.set_stdtranslation(languages=[language])
+            self.form_language = language
 
     def __call__(self, environ, start_response):
-
-        def clear_start_response(status, response_headers, exc_info=None):
-            """Sub start_response for cleaning after content generation"""
-
-            try:
-                return start_response(status, response_headers, exc_info)
-            finally:
-                #allways clean session connections
-                #TODO: Check if this is not going to mess with other requests
-                db.clean_database_session()
-
         #get view handler from environ
         view_handler = environ.get('duende.view')
         if not view_handler:
@@ -138,8 +133,12 @@ class DuendeApplication(object):
             raise DuendeApplicationException(msg)
 
         #init request context
-        self._init_translations(environ)
-        self._init_locale(environ)
+        #TODO: Allow setting locale using request parameters
+        accept_language = environ.get('HTTP_ACCEPT_LANGUAGE', '')
+        (locale_list, locale) = self.locale_negotiator.negotiate(
+            accept_language)
+        self._init_translations(environ, locale_list)
+        self._init_locale(environ, locale)
         self._init_globals(environ)
 
         #init keyword arguments for view when available
@@ -147,6 +146,41 @@ class DuendeApplication(object):
         if 'duende.view_kwargs' in environ:
             view_kwargs.update(environ['duende.view_kwargs'])
 
-        response = view_handler(REQUEST, **view_kwargs)
-
-        return response(environ, clear_start_response)
+        db_stats = environ['duende.db.stats'] = db.start_request_stats()
+        db.start_request_routing(environ['REQUEST_METHOD'])
+        sqlprofiling.start_request_profile(environ.get('PATH_INFO', ''))
+        if self.db_stats_header:
+            #resource handlers return WSGI applications that are not
+            #webob responses, so header is added when response starts
+            start_response = self._get_stats_start_response(start_response,
+                                                            db_stats)
+
+        try:
+            response = view_handler(REQUEST, **view_kwargs)
+            app_iter = response(environ, start_response)
+        except Exception:
+            #views can raise HTTP exceptions or fail, so request state
+            #must be cleaned before it is used by next thread request
+            self._finish_request()
+            raise
+
+        #allways clean session connections after response contents are
+        #sent, because streamed responses can use database while iterated
+        return add_close(app_iter, self._finish_request)
+
+    def _get_stats_start_response(self, start_response, db_stats):
+        def stats_start_response(status, headers, exc_info=None):
+            headers = list(headers)
+            headers.append(('X-DB-Stats', str(unicode(db_stats))))
+
+            return start_response(status, headers, exc_info)
+
+        return stats_start_response
+
+    def _finish_request(self):
+        db.clean_database_session()
+        db.finish_request_routing()
+        sqlprofiling.finish_request_profile()
+        db_stats = db.finish_request_stats()
+        if db_stats and db_stats.query_count:
+            LOG.debug(u'Database usage: %s', db_stats)
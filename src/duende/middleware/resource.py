@@ -0,0 +1,63 @@
+# -*- coding: utf8 -*-
+#
+# Copyright (c) 2011, Jerónimo José Albi <jeronimo.albi@gmail.com>
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of copyright holders nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+# NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+# THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+from duende import httpexc
+from duende.lib import urls
+
+
+class ResourceMiddleware:
+    """Middleware to serve file and redirect resources
+
+    Resources are served before the rest of middlewares are called, so no
+    session, authentication or translation is initialized for them.
+    Resources generated by views are left to the view resolver.
+
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.resource_handlers = {}
+        for (name, handler) in urls.get_resource_handlers().items():
+            if handler.standalone:
+                self.resource_handlers[name] = handler
+
+    def __call__(self, environ, start_response):
+        url = environ['PATH_INFO'].strip(u'/')
+        url = url.lower()
+        handler = self.resource_handlers.get(url)
+        if not handler:
+            return self.application(environ, start_response)
+
+        try:
+            response = handler()
+        except httpexc.HTTPException, exc:
+            response = exc
+
+        return response(environ, start_response)
@@ -31,12 +31,15 @@
 import re
 import logging
 
+from paste.deploy.converters import asint
 from paste.util.import_string import try_import_module
 
 from duende import httpexc
 from duende import get_enabled_app_list
 from duende.lib import urls
-from duende.lib import resource
+from duende.lib.cache import LRUCache
+from duende.lib.registry import get_app_registry
+from duende.lib.routing import create_router
 
 LOG = logging.getLogger(__name__)
 
@@ -54,12 +57,21 @@ class URLParseError(Exception):
 class ViewResolverMiddleware:
     """Middleware in charge of resolving URL to view"""
 
-    def __init__(self, application, config):
+    def __init__(self, application, config, view_index=None):
         self.application = application
         self.config = config
+        #when views are preloaded index is used instead of importing modules
+        self.view_index = view_index
         self.enabled_app_list = get_enabled_app_list()
-        self.url_app_mapping = urls.get_url_app_mapping()
-        self.resource_mapping = urls.get_resource_mapping()
+        self.url_app_mapping = get_app_registry().url_app_mapping
+        self.resource_handlers = urls.get_resource_handlers()
+        route_list = urls.get_route_mapping()
+        self.router = create_router(route_list, self.enabled_app_list)
+        #cache resolved views and URLs without a view by normalized URL
+        cache_size = asint(config.get('view.cache_size', 1000))
+        self.view_cache = LRUCache(cache_size)
+        cache_size = asint(config.get('view.not_found_cache_size', 1000))
+        self.not_found_cache = LRUCache(cache_size)
 
     def __call__(self, environ, start_response):
         view_handler = self.resolve_view_handler(environ)
@@ -71,16 +83,51 @@ class ViewResolverMiddleware:
         """Get view handler for current request"""
 
         LOG.debug(u'Resolving view handler')
-        view = None
         #tidy URL before processing
         url = environ['PATH_INFO'].strip(u'/')
         url = url.lower()
 
         #check if its a resource
-        if url in self.resource_mapping:
-            resource_uri = self.resource_mapping[url]
+        if url in self.resource_handlers:
+            return self.resource_handlers[url]
 
-            return resource.get_view_handler(resource_uri)
+        cached = self.view_cache.get(url)
+        if cached:
+            (view, app, view_kwargs) = cached
+        elif self.not_found_cache.get(url):
+            raise httpexc.HTTPNotFound()
+        else:
+            match = self.router.match(url)
+            if match:
+                (route, view_kwargs) = match
+                (view, app) = (route.view, route.app)
+            else:
+                #when no route matches use URL to find view
+                view_kwargs = None
+                try:
+                    (view, app) = self.find_view_handler(url)
+                except httpexc.HTTPNotFound:
+                    #remember URL to avoid importing modules on next requests
+                    self.not_found_cache.set(url, True)
+
+                    raise
+
+            self.view_cache.set(url, (view, app, view_kwargs))
+
+        #store current application name inside environment
+        environ['duende.application'] = app
+        if view_kwargs:
+            environ['duende.view_kwargs'] = view_kwargs
+
+        return view
+
+    def find_view_handler(self, url):
+        """Find view handler and application name for a normalized URL
+
+        Return a tuple with view handler and application name.
+        HTTPNotFound is raised when no view is available for URL.
+
+        """
 
         try:
             (app, module_path, view_name) = self.get_view_module_parts(url)
@@ -89,6 +136,13 @@ class ViewResolverMiddleware:
 
             raise httpexc.HTTPNotFound()
 
+        if self.view_index is not None:
+            view = self.view_index.get((app, module_path, view_name))
+            if not view:
+                raise httpexc.HTTPNotFound()
+
+            return (view, app)
+
         module_path = '%s.view.%s' % (app, module_path)
         LOG.debug(u'Request view: %s.%s()', module_path, view_name)
 
@@ -100,10 +154,16 @@ class ViewResolverMiddleware:
             #when handler is not found raise HTTP 404
             raise httpexc.HTTPNotFound()
 
-        #store current application name inside environment
-        environ['duende.application'] = app
+        return (view, app)
 
-        return view
+    def get_cache_stats(self):
+        """Get usage counters for view and not found caches"""
+
+        stats = {}
+        stats['view'] = self.view_cache.get_stats()
+        stats['not_found'] = self.not_found_cache.get_stats()
+
+        return stats
 
     def get_view_module_parts(self, url):
         """Parse a URL and return a tuple with view module path info